@@ -0,0 +1,104 @@
+"""
+一時ファイルへの逐次書き出しと置き換え
+
+出力全体を1つの文字列にまとめずに少しずつ書き出し、書き込みが完了した時点で置き換える
+(途中で中断されても書きかけのファイルが残らない)。書き込みながら内容のハッシュを計算し、
+前回と同じ内容であれば置き換えない (ファイルの mtime も変わらない)。
+"""
+import hashlib
+import json
+import os
+
+BUFFER_SIZE = 64 * 1024
+
+
+def content_digest(text):
+    """テキストのハッシュ (AtomicWriter.digest と同じ値)"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def file_digest(path):
+    """既存ファイルのハッシュ (ファイルがなければ None)"""
+    hasher = hashlib.blake2b(digest_size=8)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(BUFFER_SIZE), b""):
+                hasher.update(block)
+    except OSError:
+        return None
+    return hasher.hexdigest()
+
+
+class AtomicWriter:
+    """with 文で使う。write() した内容を path.tmp に書き出し、終了時に path を置き換える
+
+    expected_digest (前回の内容のハッシュ) と一致し、path が存在する場合は置き換えない。
+    省略した場合は既存ファイルを読んでハッシュを比較する。
+    """
+
+    def __init__(self, path, expected_digest=None):
+        self.path = str(path)
+        self.tmp_path = f"{self.path}.tmp"
+        self.expected_digest = expected_digest
+        self.digest = None
+        self.changed = False
+        self._hasher = hashlib.blake2b(digest_size=8)
+        self._pending, self._pending_size = [], 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.tmp_path, "wb")
+        return self
+
+    def write(self, text):
+        self._pending.append(text)
+        self._pending_size += len(text)
+        if self._pending_size >= BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending: return
+        data = "".join(self._pending).encode("utf-8")
+        self._pending, self._pending_size = [], 0
+        self._hasher.update(data)
+        self._file.write(data)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None: self._flush()
+        finally:
+            self._file.close()
+        if exc_type is not None:
+            try: os.remove(self.tmp_path)
+            except OSError: pass
+            return False
+        self.digest = self._hasher.hexdigest()
+        previous = self.expected_digest if self.expected_digest is not None else file_digest(self.path)
+        if previous == self.digest and os.path.exists(self.path):
+            os.remove(self.tmp_path)
+        else:
+            os.replace(self.tmp_path, self.path)
+            self.changed = True
+        return False
+
+
+def write_json_streamed(out, obj, depth=1):
+    """obj を JSON として out に書き出す
+
+    dict は depth 階層までキーごとに分けて書き出すため、全体の JSON 文字列を一度に作らない。
+    それ以下の値は json.dumps (C実装) でまとめて変換する。
+    """
+    if depth <= 0 or not isinstance(obj, dict):
+        out.write(json.dumps(obj, ensure_ascii=False, separators=(',', ':')))
+        return
+    out.write("{")
+    for i, (key, value) in enumerate(obj.items()):
+        out.write(f"{',' if i else ''}{json.dumps(str(key), ensure_ascii=False)}:")
+        write_json_streamed(out, value, depth - 1)
+    out.write("}")
+
+
+def write_json_atomic(path, obj):
+    """obj を JSON として path に書き出す (AtomicWriter を使うため、中断されても壊れず、内容が同じなら置き換えない)"""
+    with AtomicWriter(path) as out:
+        write_json_streamed(out, obj, depth=0)
@@ -0,0 +1,379 @@
+"""
+Organizer ベンチマーク
+
+合成ライブラリ (_Data / Downloads) を一時フォルダに生成し、各処理の実行時間を
+初回 (cold: キャッシュなし) と2回目以降 (warm: キャッシュあり) に分けて計測し、JSON に出力する。
+warm の各回の前には、拡張機能による保存を想定した少数の新しい画像・プロンプト・Favoritesログ・動画を追加する
+(差分処理の速度を計測する)。実際の Downloads や _Data には一切触れない。
+
+使い方:
+    python benchmark.py --days 30 --images 1000 --output result.json
+    python benchmark.py --compare old_result.json   # 前回の結果と比較 (閾値を超えて遅くなった場合は終了コード 1)
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import grok_organizer as organizer
+from instrumentation import RunRecorder
+from inventory import Inventory
+from thumbnails import pillow_available
+
+STAGES = ("move_videos", "organize_prompts", "organize_favorites", "clean_garbage_images", "index_videos",
+          "generate_viewer_html")
+
+# 解像度 (幅, 高さ) の構成比。500px 未満は削除対象
+RESOLUTIONS = (((1024, 1024), 40), ((768, 1344), 25), ((1344, 768), 25), ((400, 600), 10))
+PROMPT_WORDS = ("a cat", "sunset", "city at night", "portrait", "watercolor", "1girl", "cyberpunk street",
+                "青い空", "桜の木", "夜の街並み", "猫耳の少女", "水彩画風", "highly detailed", "cinematic lighting")
+
+
+def _png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def _png_bytes(width, height, color_type):
+    """Pillow なしで単色の PNG を作成する (color_type 2: RGB / 6: RGBA)"""
+    channels = 4 if color_type == 6 else 3
+    raw = (b"\x00" + b"\x80" * (width * channels)) * height
+    return (b"\x89PNG\r\n\x1a\n"
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+            + _png_chunk(b"IDAT", zlib.compress(raw, 1))
+            + _png_chunk(b"IEND", b""))
+
+
+def _mp4_box(kind, *parts):
+    payload = b"".join(parts)
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+_MP4_MATRIX = struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+
+def _mp4_bytes(duration, width, height, created, payload, moov_last):
+    """ヘッダー解析 (video_probe) で読める最小限の MP4 (ftyp / moov (mvhd, trak/tkhd) / mdat)"""
+    timescale = 1000
+    mp4_time = int(created) + 2082844800  # 1904-01-01 起点
+    mvhd = _mp4_box(b"mvhd", struct.pack(">IIIII", 0, mp4_time, mp4_time, timescale, int(duration * timescale)),
+                    struct.pack(">IH", 0x10000, 0x100), b"\x00" * 10, _MP4_MATRIX, b"\x00" * 24, struct.pack(">I", 2))
+    tkhd = _mp4_box(b"tkhd", struct.pack(">IIIIII", 3, mp4_time, mp4_time, 1, 0, int(duration * timescale)),
+                    b"\x00" * 16, _MP4_MATRIX, struct.pack(">II", width << 16, height << 16))
+    ftyp = _mp4_box(b"ftyp", b"isom", struct.pack(">I", 0x200), b"isomiso2mp41")
+    moov = _mp4_box(b"moov", mvhd, _mp4_box(b"trak", tkhd))
+    mdat = _mp4_box(b"mdat", payload)
+    return ftyp + mdat + moov if moov_last else ftyp + moov + mdat
+
+
+class SyntheticLibrary:
+    """ベンチマーク用の合成ライブラリを生成する
+
+    画像は形式・解像度ごとに用意したベース画像の後ろに乱数を付加して作成する
+    (デコーダーは末尾のデータを無視するため、内容は異なるが正しく読める画像になる)。
+    """
+
+    def __init__(self, root, args):
+        self.root = Path(root)
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.data_dir = self.root / "_Data"
+        self.download_dir = self.root / "Downloads"
+        self.base_images = {}
+        self.image_names = []
+        self.serial = 0  # ファイル名の連番 (追加分も含めて重複しない)
+        self.stats = {"images": 0, "duplicates": 0, "garbage": 0, "prompts": 0, "favlogs": 0, "videos": 0, "bytes": 0}
+        self.formats = [("png", 60)]
+        if pillow_available():
+            self.formats += [("jpg", 25), ("webp", 15)]
+
+    def _choice(self, weighted):
+        items, weights = zip(*weighted)
+        return self.rng.choices(items, weights)[0]
+
+    def _base_image(self, fmt, size, mode):
+        key = (fmt, size, mode)
+        data = self.base_images.get(key)
+        if data is None:
+            if fmt == "png":
+                data = _png_bytes(size[0], size[1], 6 if mode == "RGBA" else 2)
+            else:
+                from PIL import Image
+                buf = io.BytesIO()
+                Image.new(mode if fmt == "webp" else "RGB", size, (90, 120, 150)).save(buf, "JPEG" if fmt == "jpg" else "WEBP")
+                data = buf.getvalue()
+            self.base_images[key] = data
+        return data
+
+    def _write(self, path, data, ts):
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, (ts, ts))
+        self.stats["bytes"] += len(data)
+
+    def _days(self):
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return [today - timedelta(days=i) for i in range(self.args.days)]
+
+    def _random_time(self, day):
+        return day + timedelta(seconds=self.rng.randrange(0, 86400))
+
+    def _next_serial(self):
+        self.serial += 1
+        return self.serial
+
+    def add_image(self, dt):
+        """画像 (一部は削除対象: 小さいファイル・低解像度・RGBA) と、一定割合で重複を追加する"""
+        i = self._next_serial()
+        fmt = self._choice(self.formats)
+        size = self._choice(RESOLUTIONS)
+        mode = "RGBA" if fmt != "jpg" and self.rng.random() < self.args.garbage_ratio / 3 else "RGB"
+        small = self.rng.random() < self.args.garbage_ratio / 3
+        base = self._base_image(fmt, size, mode)
+        target = self.rng.randint(20, 90) * 1024 if small else self.rng.randint(110, 260) * 1024
+        data = base + self.rng.randbytes(max(target - len(base), 16))
+        if small or mode == "RGBA" or min(size) < organizer.MIN_RESOLUTION:
+            self.stats["garbage"] += 1
+        folder = self.data_dir / "Images" / dt.strftime("%Y%m%d")
+        folder.mkdir(exist_ok=True)
+        name = f"grok_image_{dt.strftime('%Y%m%d_%H%M%S')}_{i:04d}.{fmt}"
+        self._write(folder / name, data, dt.timestamp())
+        self.image_names.append(name)
+        self.stats["images"] += 1
+
+        # 重複 (同じフォルダに後から保存された同一内容のファイル)
+        if self.rng.random() < self.args.dup_ratio:
+            dup_name = f"{uuid.UUID(int=self.rng.getrandbits(128))}.{fmt}"
+            self._write(folder / dup_name, data, dt.timestamp() + 60)
+            self.stats["duplicates"] += 1
+
+    def add_prompt(self, dt, text):
+        """プロンプト (拡張機能と同じく1ファイル1件)"""
+        name = f"prompt_{dt.strftime('%Y%m%d_%H%M%S')}_{self._next_serial():04d}.txt"
+        content = f"[{dt.strftime('%Y/%m/%d %H:%M:%S')}]\n{text}\n------------------------------------\n"
+        self._write(self.data_dir / "Prompts" / name, content.encode("utf-8"), dt.timestamp())
+        self.stats["prompts"] += 1
+
+    def _prompt_text(self, previous):
+        # 連続した重複も含める
+        if previous and self.rng.random() < 0.05: return previous
+        return ", ".join(self.rng.sample(PROMPT_WORDS, self.rng.randint(2, 6)))
+
+    def add_favlog(self):
+        if not self.image_names: return
+        items = [{"filename": self.rng.choice(self.image_names), "uuid": str(uuid.UUID(int=self.rng.getrandbits(128))),
+                  "timestamp": int(time.time() * 1000)}]
+        name = f"fav_{1700000000000 + self._next_serial()}_{self.rng.randrange(1000)}.json"
+        self._write(self.data_dir / "System" / "FavLogs" / name, json.dumps(items, indent=2).encode("utf-8"), time.time())
+        self.stats["favlogs"] += 1
+
+    def add_video(self, dt):
+        """ダウンロードフォルダの動画 (moov が先頭・末尾のものを半々)"""
+        width, height = self._choice((((720, 1280), 50), ((1280, 720), 30), ((960, 960), 20)))
+        data = _mp4_bytes(self.rng.uniform(4, 15), width, height, dt.timestamp(),
+                          self.rng.randbytes(self.rng.randint(200, 800) * 1024), self.rng.random() < 0.5)
+        self._write(self.download_dir / f"grok-video-{uuid.UUID(int=self.rng.getrandbits(128))}.mp4", data, dt.timestamp())
+        self.stats["videos"] += 1
+
+    def generate(self):
+        started = time.perf_counter()
+        days = self._days()
+        for sub in ("Images", "Prompts", "System/FavLogs"):
+            (self.data_dir / sub).mkdir(parents=True, exist_ok=True)
+        self.download_dir.mkdir(parents=True, exist_ok=True)
+
+        for _ in range(self.args.images):
+            self.add_image(self._random_time(self.rng.choice(days)))
+        text = ""
+        for _ in range(self.args.prompts):
+            text = self._prompt_text(text)
+            self.add_prompt(self._random_time(self.rng.choice(days)), text)
+        for _ in range(self.args.favlogs):
+            self.add_favlog()
+        for _ in range(self.args.videos):
+            self.add_video(self._random_time(self.rng.choice(days)))
+
+        self.stats["seconds"] = round(time.perf_counter() - started, 3)
+        return self.stats
+
+    def add_new_files(self):
+        """warm の各回の前に、直近 (現在時刻の少し前) に保存された想定の新しいファイルを追加し、追加件数を返す"""
+        before = dict(self.stats)
+        now = datetime.now().replace(microsecond=0)
+        text = ""
+        for _ in range(self.args.warm_images):
+            self.add_image(now - timedelta(seconds=self.rng.randrange(60, 3600)))
+        for _ in range(self.args.warm_prompts):
+            text = self._prompt_text(text)
+            self.add_prompt(now - timedelta(seconds=self.rng.randrange(60, 3600)), text)
+        for _ in range(self.args.warm_favlogs):
+            self.add_favlog()
+        for _ in range(self.args.warm_videos):
+            self.add_video(now - timedelta(seconds=self.rng.randrange(60, 3600)))
+        return {k: self.stats[k] - before[k] for k in ("images", "duplicates", "prompts", "favlogs", "videos")}
+
+
+def point_organizer_at(root):
+    """grok_organizer のパス設定を合成ライブラリに向ける"""
+    root = Path(root)
+    organizer.GROK_ROOT_DIR = root
+    organizer.DATA_DIR = root / "_Data"
+    organizer.DEST_DIR = organizer.DATA_DIR / "Favorites"
+    organizer.VIEWER_PATH = root / "Grok_Viewer.html"
+    organizer.VIEWER_DATA_DIR = organizer.DATA_DIR / "System" / "viewer"
+    organizer.THUMB_DIR = organizer.DATA_DIR / "System" / "thumbs"
+    organizer.DOWNLOAD_DIR = root / "Downloads"
+
+
+def run_pipeline(verbose=False):
+    """main() と同じ順序で各処理を実行し、処理ごとの計測値 (instrumentation.StageMetrics) を返す"""
+    inventory = Inventory()
+    state = {"fav_set": set()}
+    calls = {
+        "move_videos": lambda: organizer.move_videos(inventory),
+        "organize_prompts": lambda: organizer.organize_prompts(inventory),
+        "organize_favorites": lambda: state.update(fav_set=organizer.organize_favorites(inventory)),
+        "clean_garbage_images": lambda: organizer.clean_garbage_images(state["fav_set"], inventory),
+        "index_videos": lambda: organizer.index_videos(inventory),
+        "generate_viewer_html": lambda: organizer.generate_viewer_html(state["fav_set"], inventory, open_browser=False),
+    }
+    recorder = RunRecorder([])
+    for name in STAGES:
+        sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with sink, recorder.stage(name, inventory):
+            calls[name]()
+    stages = {m.name: {k: v for k, v in m.as_dict().items() if k != "name"} for m in recorder.stages}
+    return {"stages": stages, "total": round(sum(m.wall for m in recorder.stages), 4)}
+
+
+def print_runs(runs):
+    print(f"\n {'stage':<24}" + "".join(f"{run['name']:>12}" for run in runs))
+    for name in STAGES:
+        print(f" {name:<24}" + "".join(f"{run['stages'][name]['wall']:>11.3f}s" for run in runs))
+    print(f" {'total':<24}" + "".join(f"{run['total']:>11.3f}s" for run in runs))
+
+
+def compare(result, baseline_path, threshold):
+    """前回の結果と比較し、閾値を超えて遅くなった項目数を返す"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    old_runs = {run["name"]: run for run in baseline.get("runs", [])}
+    regressions = 0
+    print(f"\n [Compare] {baseline_path} (閾値: +{threshold:.0%})")
+    for run in result["runs"]:
+        old = old_runs.get(run["name"])
+        if not old: continue
+        for name in STAGES + ("total",):
+            new_t = run["total"] if name == "total" else run["stages"][name]["wall"]
+            old_t = old["total"] if name == "total" else old["stages"].get(name, {}).get("wall")
+            if not old_t: continue
+            ratio = new_t / old_t - 1
+            # ごく短い処理は誤差が大きいため判定しない
+            slow = ratio > threshold and new_t - old_t > 0.05
+            regressions += slow
+            mark = "  ⚠️ 遅くなりました" if slow else ""
+            print(f"   {run['name']:<8} {name:<24} {old_t:>9.3f}s -> {new_t:>9.3f}s ({ratio:+.0%}){mark}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Grok Organizer ベンチマーク (合成ライブラリで各処理を計測)")
+    parser.add_argument("--days", type=int, default=30, help="日付フォルダ数")
+    parser.add_argument("--images", type=int, default=1000, help="画像数")
+    parser.add_argument("--prompts", type=int, default=2000, help="prompt_*.txt の数")
+    parser.add_argument("--favlogs", type=int, default=200, help="FavLogs の JSON ファイル数")
+    parser.add_argument("--videos", type=int, default=30, help="ダウンロードフォルダの動画数")
+    parser.add_argument("--dup-ratio", type=float, default=0.03, help="重複画像の割合")
+    parser.add_argument("--garbage-ratio", type=float, default=0.08, help="削除対象 (小さい・RGBA) 画像の割合")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warm-runs", type=int, default=2, help="2回目以降 (キャッシュあり) の計測回数")
+    parser.add_argument("--warm-images", type=int, default=20, help="warm の各回の前に追加する画像数")
+    parser.add_argument("--warm-prompts", type=int, default=20, help="warm の各回の前に追加する prompt_*.txt の数")
+    parser.add_argument("--warm-favlogs", type=int, default=5, help="warm の各回の前に追加する FavLogs の数")
+    parser.add_argument("--warm-videos", type=int, default=2, help="warm の各回の前に追加する動画数")
+    parser.add_argument("--workers", type=int, default=None, help="並列プロセス数 (grok_organizer の --workers と同じ)")
+    parser.add_argument("--root", help="合成ライブラリの作成先 (省略時は一時フォルダを作成し、終了後に削除)")
+    parser.add_argument("--output", help="結果の JSON ファイル (省略時: benchmark_YYYYMMDD_HHMMSS.json)")
+    parser.add_argument("--compare", help="比較する前回の結果 (JSON)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったと判定する割合 (既定: 0.2 = 20%%)")
+    parser.add_argument("--verbose", action="store_true", help="各処理のログを表示する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.workers is not None:
+        organizer.WORKER_COUNT = max(args.workers, 0)
+
+    if args.root:
+        root = Path(args.root)
+        if root.exists() and any(root.iterdir()):
+            print(f" [Error] 作成先が空ではありません: {root}")
+            return 2
+        root.mkdir(parents=True, exist_ok=True)
+    else:
+        root = Path(tempfile.mkdtemp(prefix="grok_bench_"))
+
+    try:
+        print(f" [Bench] 合成ライブラリを生成中: {root}")
+        library = SyntheticLibrary(root, args)
+        generated = library.generate()
+        print(f"   画像 {generated['images']} (重複 {generated['duplicates']}, 削除対象 {generated['garbage']}) / "
+              f"プロンプト {generated['prompts']} / FavLogs {generated['favlogs']} / 動画 {generated['videos']} / "
+              f"{generated['bytes'] / 1024 / 1024:.0f}MB ({generated['seconds']:.1f}秒)")
+
+        point_organizer_at(root)
+        runs = []
+        for i in range(1 + max(args.warm_runs, 0)):
+            name = "cold" if i == 0 else f"warm{i}" if args.warm_runs > 1 else "warm"
+            added = library.add_new_files() if i else None
+            print(f" [Bench] {name} 実行中..." + (f" (追加: 画像 {added['images']} / プロンプト {added['prompts']} / "
+                                                   f"FavLogs {added['favlogs']} / 動画 {added['videos']})" if added else ""))
+            run = run_pipeline(args.verbose)
+            run["name"] = name
+            if added: run["added"] = added
+            runs.append(run)
+        print_runs(runs)
+
+        result = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pillow": pillow_available(),
+            "workers": organizer.WORKER_COUNT,
+            "params": {k: getattr(args, k) for k in ("days", "images", "prompts", "favlogs", "videos",
+                                                      "dup_ratio", "garbage_ratio", "seed", "warm_images",
+                                                      "warm_prompts", "warm_favlogs", "warm_videos")},
+            "generated": generated,
+            "runs": runs,
+        }
+        output = Path(args.output or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f"\n [OK] 結果を保存しました: {output}")
+
+        if args.compare:
+            return 1 if compare(result, args.compare, args.threshold) else 0
+        return 0
+    finally:
+        if not args.root:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # EXE (PyInstaller) でのプロセスプール利用に必要
+    multiprocessing.freeze_support()
+    sys.exit(main())
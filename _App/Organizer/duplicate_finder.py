@@ -0,0 +1,154 @@
+"""
+段階的な重複ファイル検出
+
+1. サイズでバケット分け (同サイズのファイルが無ければ読み込み不要)
+2. 先頭・末尾の数KBのみを部分ハッシュ
+3. 部分ハッシュが一致したファイルのみ全体をチャンク単位でハッシュ (BLAKE2b)
+"""
+import hashlib
+import os
+
+PARTIAL_SIZE = 4 * 1024
+CHUNK_SIZE = 1024 * 1024
+DIGEST_SIZE = 16
+
+
+class HashStats:
+    """ハッシュ処理で読み込んだバイト数の集計"""
+
+    def __init__(self):
+        self.files = 0
+        self.partial = 0
+        self.full = 0
+        self.bytes_read = 0
+
+    def summary(self):
+        return (f"{self.files} 件 (部分ハッシュ: {self.partial}, 全体ハッシュ: {self.full}, "
+                f"読込: {self.bytes_read / (1024 * 1024):.1f}MB)")
+
+
+def partial_hash(path, size, stats=None):
+    """先頭と末尾 PARTIAL_SIZE バイトのハッシュ"""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, "rb") as f:
+        head = f.read(PARTIAL_SIZE)
+        h.update(head)
+        read = len(head)
+        if size > PARTIAL_SIZE * 2:
+            f.seek(-PARTIAL_SIZE, os.SEEK_END)
+            tail = f.read(PARTIAL_SIZE)
+            h.update(tail)
+            read += len(tail)
+        elif size > PARTIAL_SIZE:
+            rest = f.read()
+            h.update(rest)
+            read += len(rest)
+    if stats:
+        stats.partial += 1
+        stats.bytes_read += read
+    return h.hexdigest()
+
+
+def full_hash(path, stats=None):
+    """ファイル全体のハッシュ (バッファを使い回してチャンク単位で読む)"""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    read = 0
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n: break
+            h.update(view[:n])
+            read += n
+    if stats:
+        stats.full += 1
+        stats.bytes_read += read
+    return h.hexdigest()
+
+
+def hash_worker(job):
+    """プロセスプール用: (path, size, kind) -> (digest, bytes_read)。読めない場合 digest は None"""
+    path, size, kind = job
+    stats = HashStats()
+    try:
+        digest = partial_hash(path, size, stats) if kind == "partial" else full_hash(path, stats)
+    except OSError:
+        return None, stats.bytes_read
+    return digest, stats.bytes_read
+
+
+def _hash_all(items, kind, stats, cache, executor):
+    """items の各ファイルのハッシュを {path: digest} で返す (キャッシュ優先、未計算分は一括で処理)"""
+    digests, missing = {}, []
+    for item in items:
+        p, size, mtime_ns = item
+        value = cache.get_hash(p, size, mtime_ns, kind) if cache else None
+        if value is None:
+            missing.append(item)
+        else:
+            digests[p] = value
+
+    jobs = [(p, size, kind) for p, size, _ in missing]
+    results = executor.map(hash_worker, jobs, chunksize=8) if executor else map(hash_worker, jobs)
+    for (p, size, mtime_ns), (digest, read) in zip(missing, results):
+        stats.bytes_read += read
+        if digest is None: continue
+        if kind == "partial":
+            stats.partial += 1
+        else:
+            stats.full += 1
+        digests[p] = digest
+        if cache: cache.set_hash(p, size, mtime_ns, kind, digest)
+    return digests
+
+
+def _bucket(items, key_func):
+    buckets = {}
+    for item in items:
+        key = key_func(item)
+        if key is None: continue
+        buckets.setdefault(key, []).append(item)
+    return [group for group in buckets.values() if len(group) > 1]
+
+
+def find_duplicate_groups(paths, stats=None, cache=None, executor=None, stat_func=os.stat):
+    """内容が同一のファイルのグループ (2件以上・同一フォルダ内) のリストを返す
+
+    cache には get_hash / set_hash を持つオブジェクト (VerdictCache) を、
+    executor には ProcessPoolExecutor を渡せる。結果は executor の有無に関わらず同一。
+    stat_func に Inventory.stat を渡すと列挙時の stat 情報を再利用する。
+    """
+    if stats is None: stats = HashStats()
+    sized = []
+    for p in paths:
+        try:
+            st = stat_func(p)
+        except OSError:
+            continue
+        sized.append((p, st.st_size, st.st_mtime_ns))
+    stats.files += len(sized)
+
+    # 1. 同一フォルダ・同一サイズのファイルのみ候補に残す
+    candidates = [item for group in _bucket(sized, lambda item: (os.path.dirname(item[0]), item[1]))
+                  for item in group]
+
+    # 2. 部分ハッシュ
+    partial = _hash_all(candidates, "partial", stats, cache, executor)
+    partial_groups = _bucket(candidates, lambda item: (os.path.dirname(item[0]), item[1], partial[item[0]])
+                             if item[0] in partial else None)
+
+    groups, need_full = [], []
+    for group in partial_groups:
+        if group[0][1] <= PARTIAL_SIZE * 2:
+            # 部分ハッシュがファイル全体を網羅している
+            groups.append([item[0] for item in group])
+        else:
+            need_full.extend(group)
+
+    # 3. 全体ハッシュ
+    full = _hash_all(need_full, "full", stats, cache, executor)
+    for group in _bucket(need_full, lambda item: (os.path.dirname(item[0]), item[1], full[item[0]])
+                         if item[0] in full else None):
+        groups.append([item[0] for item in group])
+    return groups
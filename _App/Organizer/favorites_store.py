@@ -0,0 +1,95 @@
+"""
+Favorites ストア (SQLite)
+
+Favorites のファイル名と UUID (拡張機能が URL から抽出した ID) を保存する。
+ファイル名・UUID のどちらでもインデックスで検索でき、追加は既存データを書き直さずに行う。
+旧形式の All_Favorites_Merged.json は初回に取り込み、.migrated に名前を変えて残す。
+"""
+import json
+import os
+import sqlite3
+
+STORE_FILE = "favorites.db"
+STORE_VERSION = 1
+LEGACY_FILE = "All_Favorites_Merged.json"
+
+
+class FavoritesStore:
+    """Favorites のファイル名 / UUID のストア"""
+
+    def __init__(self, db_path, legacy_path=None):
+        self.db_path = db_path
+        try:
+            self.conn = self._connect()
+        except sqlite3.DatabaseError:
+            # 破損時は作り直す (Favorites は再構築できないため、破損したファイルは .broken として残す)
+            print(f"   [Warning] Favorites データベースが破損しているため作り直します: {db_path}")
+            try: os.replace(db_path, f"{db_path}.broken")
+            except OSError: pass
+            self.conn = self._connect()
+        if legacy_path is not None and os.path.exists(legacy_path):
+            self._migrate_legacy(legacy_path)
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("""CREATE TABLE IF NOT EXISTS favorites (
+            filename TEXT PRIMARY KEY, uuid TEXT, added_at INTEGER)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS favorites_uuid ON favorites(uuid)")
+        conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        conn.commit()
+        return conn
+
+    def _migrate_legacy(self, legacy_path):
+        """旧形式の JSON (filename のリスト) を取り込む"""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            added = self.add_many(parse_log_items(items))
+            os.replace(legacy_path, f"{legacy_path}.migrated")
+            print(f"   [System] 旧形式の Favorites ({added} 件) をデータベースに移行しました。")
+        except Exception as e:
+            print(f"   [Warning] 旧形式の Favorites の移行に失敗しました: {e}")
+
+    def add_many(self, items):
+        """(filename, uuid, added_at) を1トランザクションで追加する。新規に追加した件数を返す
+
+        登録済みのファイル名は UUID が未登録の場合のみ UUID を補う。
+        """
+        items = [item for item in items if item[0]]
+        if not items: return 0
+        with self.conn:
+            added = self.conn.executemany(
+                "INSERT OR IGNORE INTO favorites (filename, uuid, added_at) VALUES (?, ?, ?)", items).rowcount
+            self.conn.executemany("UPDATE favorites SET uuid = ? WHERE filename = ? AND uuid IS NULL",
+                                  [(uuid, filename) for filename, uuid, _ in items if uuid])
+        return added
+
+    def add(self, filename, uuid=None, added_at=None):
+        return self.add_many([(filename, uuid, added_at)])
+
+    def __contains__(self, filename):
+        return self.conn.execute("SELECT 1 FROM favorites WHERE filename = ?", (filename,)).fetchone() is not None
+
+    def find_by_uuid(self, uuid):
+        """UUID に対応するファイル名 (未登録なら None)"""
+        row = self.conn.execute("SELECT filename FROM favorites WHERE uuid = ? LIMIT 1", (uuid,)).fetchone()
+        return row[0] if row else None
+
+    def filenames(self):
+        return {row[0] for row in self.conn.execute("SELECT filename FROM favorites")}
+
+    def close(self):
+        self.conn.close()
+
+
+def parse_log_items(items):
+    """FavLogs / 旧形式 JSON の内容 (リストまたは単一の dict) から (filename, uuid, added_at) を取り出す"""
+    if isinstance(items, dict): items = [items]
+    if not isinstance(items, list): return []
+    result = []
+    for item in items:
+        if isinstance(item, dict) and item.get("filename"):
+            timestamp = item.get("timestamp")
+            result.append((str(item["filename"]), item.get("uuid") or None,
+                           int(timestamp) if isinstance(timestamp, (int, float)) else None))
+    return result
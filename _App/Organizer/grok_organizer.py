@@ -1,34 +1,17 @@
 import os
-import shutil
-import glob
+import sys
+import time
+_LOAD_STARTED = time.perf_counter()  # 起動時間の計測用 (スクリプトの読み込み開始)
 import json
-import html
 import re
-import hashlib
-import webbrowser
+import shutil
 from pathlib import Path
 from datetime import datetime
 
-# 画像処理ライブラリ
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
-import sys
-
-# 色出力用 (任意)
-try:
-    from colorama import init, Fore, Style
-    init()
-except ImportError:
-    class Fore:
-        CYAN = ""
-        GREEN = ""
-        RED = ""
-        YELLOW = ""
-    class Style:
-        RESET_ALL = ""
+# 起動を速くするため、Pillow / SQLite / プロセスプール等を使うモジュールは各処理の中で読み込む
+from atomic_writer import AtomicWriter, write_json_atomic, write_json_streamed
+from instrumentation import RunRecorder, measure_startup, format_startup, prune_reports
+from inventory import Inventory
 
 # ==========================================
 # 設定エリア
@@ -54,8 +37,38 @@ else:
 DATA_DIR = GROK_ROOT_DIR / "_Data"
 DEST_DIR = DATA_DIR / "Favorites"
 VIEWER_PATH = GROK_ROOT_DIR / "Grok_Viewer.html"
+VIEWER_DATA_DIR = DATA_DIR / "System" / "viewer" # 日付ごとのデータ (YYYY-MM-DD.js) と index.js
+THUMB_DIR = DATA_DIR / "System" / "thumbs" # ビューアー一覧用サムネイル (WebP)
+REPORT_DIR = DATA_DIR / "System" / "reports" # 実行ごとの計測レポート (run_*.json) と --profile の結果
 MERGED_PROMPT_FILE = "All_Prompts_Merged.txt"
-FAVORITES_DB_FILE = "All_Favorites_Merged.json"
+RUN_STATE_FILE = "last_run.json" # 前回の実行完了時の各フォルダの状態 (変更がない場合の高速終了用)
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+# ファイル名に含まれる保存日時 (_YYYYMMDD_HHMMSS_, ローカル時刻)
+FILE_STAMP_RE = re.compile(r'_(\d{8})_(\d{6})_')
+
+# 画像クリーニングの削除条件
+MIN_FILE_SIZE_KB = 100
+MIN_RESOLUTION = 500
+
+# 画像検査・ハッシュ計算の並列プロセス数 (0: CPU数に合わせて自動, 1: 逐次処理)
+WORKER_COUNT = 0
+# 対象ファイルがこの件数未満の場合はプロセス起動コストの方が大きいため逐次処理する
+PARALLEL_MIN_FILES = 200
+
+# 類似画像の削除 (--similar): 知覚ハッシュ (dHash, 64bit) の距離がこの値以下の画像を同一とみなす
+# 再エンコード・縮小・形式違いは概ね 0〜4。大きくすると構図の近い別画像も対象になるため、先に --similar-dry-run で確認する
+SIMILAR_MODE = False
+SIMILAR_THRESHOLD = 4
+SIMILAR_DRY_RUN = False
+
+# ビューアーのプロンプトと画像・動画の対応付け: 画像・動画の日時以前で最も新しいプロンプトに対応付ける (なければ PROMPT_LATE_SEC 秒後までのプロンプト)
+# プロンプトとの差が PROMPT_WINDOW_SEC を超える画像・動画はプロンプトなしとして表示する
+PROMPT_WINDOW_SEC = 3 * 3600
+PROMPT_LATE_SEC = 10
+
+# 常駐モード (--watch): 更新からこの秒数が経過していない動画は書き込み中とみなして移動しない
+VIDEO_SETTLE_SEC = 5
 
 # ==========================================
 # 処理ロジック
@@ -69,11 +82,15 @@ def is_safe_directory(path):
         return False
     return True
 
-def move_videos():
-    """動画ファイルを日付フォルダへ移動し、ファイル名に日時を付与する"""
+def move_videos(inventory=None, settle_sec=0):
+    """動画ファイルを日付フォルダへ移動し、ファイル名に日時を付与する
+
+    settle_sec を指定した場合、更新から指定秒数が経過していないファイル (ダウンロード中) は移動しない。
+    """
     print(f" [Videos] 動画移動処理開始...")
+    if inventory is None: inventory = Inventory()
     count = 0
-    target_files = list(DOWNLOAD_DIR.glob("grok-video-*.mp4"))
+    target_files = inventory.files(DOWNLOAD_DIR, pattern="grok-video-*.mp4")
 
     if not target_files:
         print("   動画ファイルは見つかりませんでした。")
@@ -81,13 +98,17 @@ def move_videos():
 
     for file_path in target_files:
         try:
-            ts = file_path.stat().st_mtime
+            ts = inventory.stat(file_path).st_mtime
+            if settle_sec and (time.time() - ts < settle_sec or inventory.exists(f"{file_path}.crdownload")):
+                print(f"   [Info] 書き込み中のためスキップ: {file_path.name}")
+                continue
             dt = datetime.fromtimestamp(ts)
             date_str = dt.strftime('%Y%m%d')
             target_dir = DATA_DIR / "Images" / date_str
             target_dir.mkdir(parents=True, exist_ok=True)
+            inventory.add(target_dir)
 
-            if not re.search(r'_\d{8}_\d{6}_', file_path.name):
+            if not FILE_STAMP_RE.search(file_path.name):
                 time_str = dt.strftime('%Y%m%d_%H%M%S')
                 new_name = file_path.name.replace("grok-video-", f"grok-video_{time_str}_")
                 if new_name == file_path.name:
@@ -96,467 +117,844 @@ def move_videos():
                 new_name = file_path.name
 
             target_path = target_dir / new_name
-            if target_path.exists():
+            if inventory.exists(target_path):
                 stem, suffix = Path(new_name).stem, Path(new_name).suffix
                 counter = 1
-                while target_path.exists():
+                while inventory.exists(target_path):
                     target_path = target_dir / f"{stem}_{counter}{suffix}"
                     counter += 1
             
             shutil.move(str(file_path), str(target_path))
+            inventory.move(file_path, target_path)
             print(f"   [OK] [移動] {file_path.name} -> {date_str}/{target_path.name}")
             count += 1
         except Exception as e:
             print(f"   [Error] [エラー] {file_path.name}: {e}")
     return count
 
-def remove_content_duplicates(target_dirs, fav_set=None):
-    """コンテンツハッシュ(MD5)による重複画像の削除 (フォルダ内限定)"""
+def create_worker_pool(job_count):
+    """並列処理用のプロセスプールを返す (逐次処理で十分な場合は None)"""
+    workers = WORKER_COUNT or os.cpu_count() or 1
+    if workers <= 1 or job_count < PARALLEL_MIN_FILES:
+        return None
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=min(workers, job_count))
+
+class WorkerPool:
+    """必要になった時点で作成するプロセスプール (ProcessPoolExecutor と同じ map を持つ)
+
+    各処理はキャッシュにないファイルのみを map に渡すため、その件数でプールの要否を判定する。
+    変更が数件のみの場合はプロセスを起動せずに逐次処理し、一度起動したプールは以降の処理でも使う。
+    """
+
+    def __init__(self):
+        self.executor = None
+
+    def map(self, func, jobs, chunksize=1):
+        jobs = list(jobs)
+        if self.executor is None:
+            self.executor = create_worker_pool(len(jobs))
+            if self.executor is None: return map(func, jobs)
+        return self.executor.map(func, jobs, chunksize=chunksize)
+
+    def shutdown(self):
+        if self.executor: self.executor.shutdown()
+
+def remove_content_duplicates(target_dirs, fav_set=None, verdict_cache=None, executor=None, inventory=None):
+    """コンテンツハッシュ(BLAKE2b)による重複画像の削除 (フォルダ内限定)"""
+    from duplicate_finder import find_duplicate_groups, HashStats
     if fav_set is None: fav_set = set()
+    if inventory is None: inventory = Inventory()
     total_del_count = 0
     new_favorites_global = [] # List of filenames to add to DB
+    hash_stats = HashStats()
     
-    for d in target_dirs:
-        hash_map = {} # {md5: [path1, path2, ...]}
-        for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
-            for p in d.glob(ext):
-                if not p.is_file(): continue
-                try:
-                    with open(p, "rb") as f:
-                        file_hash = hashlib.md5(f.read()).hexdigest()
-                    if file_hash in hash_map:
-                        hash_map[file_hash].append(p)
-                    else:
-                        hash_map[file_hash] = [p]
-                except Exception: pass
-        
-        for md5, paths in hash_map.items():
-            if len(paths) < 2: continue
-            
+    image_files = []
+    for d in dict.fromkeys(target_dirs): # 同一フォルダの二重登録を除外
+        image_files.extend(inventory.files(d, IMAGE_EXTS))
+
+    # サイズ -> 部分ハッシュ -> 全体ハッシュの順に候補を絞り込む (ハッシュ計算のみ並列化)
+    if image_files:
+        for paths in find_duplicate_groups(image_files, hash_stats, verdict_cache, executor,
+                                           stat_func=inventory.stat):
             # フォルダ内での重複を整理 (一番古いものを残す)
-            paths.sort(key=lambda x: x.stat().st_mtime)
+            paths.sort(key=lambda x: inventory.stat(x).st_mtime)
             keeper = paths[0]
             removals = paths[1:]
             
-            # Check Favorite Inheritance
-            is_keeper_fav = keeper.name in fav_set
-            has_removed_fav = any(p.name in fav_set for p in removals)
-            
-            if has_removed_fav and not is_keeper_fav:
-                print(f"   ⭐ [Favorite] {keeper.name} がFavoritesステータスを継承しました。")
-                new_favorites_global.append(keeper.name)
-                fav_set.add(keeper.name)
+            inherit_favorite(keeper, removals, fav_set, new_favorites_global)
             
             for p in removals:
                 try:
                     print(f"   🗑️ [Duplicate] 削除: {p.name} (Keep: {keeper.name})")
                     os.remove(p)
+                    inventory.discard(p)
+                    if verdict_cache: verdict_cache.discard(p)
                     total_del_count += 1
                 except Exception as e:
                     print(f"   ⚠️ [Error] 削除失敗: {p.name} ({e})")
                 
+    print(f"   [Hash] {hash_stats.summary()}")
     if total_del_count > 0:
         print(f"   [Duplicate] 合計 {total_del_count} 件の重複ファイルを削除しました。")
     
     # Save inherited favorites if any
-    if new_favorites_global:
+    save_inherited_favorites(new_favorites_global)
+
+def inherit_favorite(keeper, removals, fav_set, new_favorites):
+    """削除する画像が Favorites の場合、残す画像にステータスを引き継ぐ"""
+    if keeper.name in fav_set: return
+    if any(p.name in fav_set for p in removals):
+        print(f"   ⭐ [Favorite] {keeper.name} がFavoritesステータスを継承しました。")
+        new_favorites.append(keeper.name)
+        fav_set.add(keeper.name)
+
+def open_favorites_store():
+    """Favorites ストアを開く (旧形式の JSON があれば取り込む)"""
+    from favorites_store import FavoritesStore, STORE_FILE, LEGACY_FILE
+    system_dir = DATA_DIR / "System"
+    system_dir.mkdir(parents=True, exist_ok=True)
+    return FavoritesStore(system_dir / STORE_FILE, system_dir / LEGACY_FILE)
+
+def save_inherited_favorites(names):
+    """継承した Favorites をストアに追加する"""
+    if not names: return
+    try:
+        store = open_favorites_store()
         try:
-            db_path = DATA_DIR / "System" / FAVORITES_DB_FILE
-            current_data = []
-            if db_path.exists():
-                with open(db_path, "r", encoding="utf-8") as f:
-                    current_data = json.load(f)
-            
-            for name in new_favorites_global:
-                current_data.append({"filename": name})
-                
-            with open(db_path, "w", encoding="utf-8") as f:
-                json.dump(current_data, f, indent=2, ensure_ascii=False)
-            print(f"   [System] {len(new_favorites_global)} 件のFavorites情報を統合しました。")
+            store.add_many([(name, None, None) for name in names])
+        finally:
+            store.close()
+        print(f"   [System] {len(names)} 件のFavorites情報を統合しました。")
+    except Exception as e:
+        print(f"   ⚠️ [Error] Favorites保存失敗: {e}")
+
+def remove_similar_images(date_dirs, fresh_dirs, fav_set=None, verdict_cache=None, executor=None, inventory=None):
+    """知覚ハッシュ (dHash) による類似画像 (再エンコード・縮小・形式違い) の削除 (全日付フォルダ対象)
+
+    fresh_dirs (前回の比較以降に変更のあったフォルダ) の画像と新たにハッシュを計算した画像のみを起点に、
+    BK-tree で SIMILAR_THRESHOLD 以内の画像を検索する (変更のない画像同士は前回までに比較済み)。
+    SIMILAR_DRY_RUN の場合は削除せず、対象の組を表示・レポートに出力する。
+    削除件数を返す (Pillow がなく検索できなかった場合は None)。
+    """
+    from perceptual_hash import BKTree, dhash_worker, hamming
+    from thumbnails import pillow_available
+    if fav_set is None: fav_set = set()
+    if inventory is None: inventory = Inventory()
+    threshold = SIMILAR_THRESHOLD
+    print(f"   [Similar] 類似画像を検索中... (距離 {threshold} 以下{', dry-run' if SIMILAR_DRY_RUN else ''})")
+
+    # 1. ハッシュの収集 (変更のない画像はキャッシュを使う)
+    hashes, missing = {}, []
+    for d in date_dirs:
+        for file_path in inventory.files(d, IMAGE_EXTS):
+            try:
+                st = inventory.stat(file_path)
+            except OSError:
+                continue
+            value = verdict_cache.get_dhash(file_path, st.st_size, st.st_mtime_ns) if verdict_cache else None
+            if value is None:
+                missing.append((file_path, st))
+            else:
+                hashes[file_path] = value
+
+    if missing:
+        if not pillow_available():
+            print(f"   [Warning] Pillow が未インストールのため類似画像の検索をスキップしました。")
+            return None
+        own_pool = executor is None and create_worker_pool(len(missing))
+        pool = executor or own_pool
+        try:
+            paths = [file_path for file_path, _ in missing]
+            results = pool.map(dhash_worker, paths, chunksize=16) if pool else map(dhash_worker, paths)
+            for i, ((file_path, st), value) in enumerate(zip(missing, results), 1):
+                if i % 50 == 0:
+                    print(f"\r   [Processing] 知覚ハッシュ計算中... ({i}/{len(missing)})", end="", flush=True)
+                if value is None: continue
+                hashes[file_path] = value
+                if verdict_cache: verdict_cache.set_dhash(file_path, st.st_size, st.st_mtime_ns, value)
+        finally:
+            if own_pool: own_pool.shutdown()
+        print(f"\r   [Similar] 知覚ハッシュ: 計算 {len(missing)} 件 / キャッシュ {len(hashes) - len(missing)} 件" + " " * 10)
+
+    # 2. 近傍検索 (新しい画像を起点に、全画像の BK-tree から探す)
+    tree = BKTree()
+    for file_path, value in hashes.items():
+        tree.add(value, file_path)
+    fresh_dirs = set(fresh_dirs)
+    fresh = {file_path for file_path, _ in missing} | {p for p in hashes if p.parent in fresh_dirs}
+    neighbors = {}
+    for file_path in fresh:
+        if file_path not in hashes: continue
+        for _, other in tree.search(hashes[file_path], threshold):
+            if other == file_path: continue
+            neighbors.setdefault(file_path, set()).add(other)
+            neighbors.setdefault(other, set()).add(file_path)
+
+    # 3. つながった画像ごとに、古い順に「残す画像」を決め、それとの距離が閾値以内の新しい画像を削除対象とする
+    #    (A≒B, B≒C でも A と C が離れている場合に C まで消さないよう、残す画像との距離で判定する)
+    pairs, visited = [], set()
+    for start in neighbors:
+        if start in visited: continue
+        component, stack = [], [start]
+        visited.add(start)
+        while stack:
+            node = stack.pop()
+            component.append(node)
+            for other in neighbors[node]:
+                if other not in visited:
+                    visited.add(other)
+                    stack.append(other)
+        component.sort(key=lambda x: inventory.stat(x).st_mtime)
+        assigned = set()
+        for keeper in component:
+            if keeper in assigned: continue
+            assigned.add(keeper)
+            removals = [(p, hamming(hashes[keeper], hashes[p])) for p in component if p not in assigned]
+            removals = [(p, distance) for p, distance in removals if distance <= threshold]
+            if removals:
+                assigned.update(p for p, _ in removals)
+                pairs.append((keeper, removals))
+
+    if not pairs:
+        print(f"   [Similar] 類似画像はありません。")
+        return 0
+
+    if SIMILAR_DRY_RUN:
+        report = []
+        for keeper, removals in pairs:
+            for p, distance in removals:
+                print(f"   [Similar] (dry-run) {p.parent.name}/{p.name} -> Keep: {keeper.parent.name}/{keeper.name} (距離 {distance})")
+                report.append({"keep": f"{keeper.parent.name}/{keeper.name}",
+                               "remove": f"{p.parent.name}/{p.name}", "distance": distance})
+        try:
+            REPORT_DIR.mkdir(parents=True, exist_ok=True)
+            report_path = REPORT_DIR / f"similar_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            write_json_atomic(report_path, report)
+            prune_reports(REPORT_DIR, "similar_")
+            print(f"   [Similar] {len(report)} 件が削除対象です (未削除)。一覧: {report_path}")
         except Exception as e:
-            print(f"   ⚠️ [Error] Favorites保存失敗: {e}")
+            print(f"   [Error] レポートの保存失敗: {e}")
+        return 0
+
+    count = 0
+    new_favorites = []
+    for keeper, removals in pairs:
+        inherit_favorite(keeper, [p for p, _ in removals], fav_set, new_favorites)
+        for p, distance in removals:
+            try:
+                print(f"   🗑️ [Similar] 削除: {p.parent.name}/{p.name} (Keep: {keeper.parent.name}/{keeper.name}, 距離 {distance})")
+                os.remove(p)
+                inventory.discard(p)
+                if verdict_cache: verdict_cache.discard(p)
+                count += 1
+            except Exception as e:
+                print(f"   ⚠️ [Error] 削除失敗: {p.name} ({e})")
+    if count > 0:
+        print(f"   [Similar] 合計 {count} 件の類似画像を削除しました。")
+    save_inherited_favorites(new_favorites)
+    return count
 
-def clean_garbage_images(fav_set=None):
-    """不要な画像を削除し、リアルタイムにログを表示する (Smart Scan対応)"""
+def clean_garbage_images(fav_set=None, inventory=None):
+    """不要な画像を削除し、リアルタイムにログを表示する (Smart Scan対応: 変更のあったフォルダのみ検査)"""
+    from image_probe import probe_many, ProbeStats
+    from verdict_cache import VerdictCache, CACHE_FILE as VERDICT_CACHE_FILE, KEEP, DELETE
     print(f"\n [Cleaning] 画像クリーニング処理開始...")
     if not is_safe_directory(GROK_ROOT_DIR):
         print(f"   [Warning] 安全装置作動。専用フォルダ内で実行してください。")
         return 0
-    if Image is None:
-        print("   [Warning] Pillowライブラリがないため解像度チェックをスキップします。")
-        return 0
+    if inventory is None: inventory = Inventory()
 
     count = 0
-    now = datetime.now()
-    today_str = now.strftime('%Y%m%d')
-    scan_targets = []
     
-    # 1. 常に当日のフォルダは対象
-    today_dir = DATA_DIR / "Images" / today_str
-    if today_dir.exists():
-        scan_targets.append(today_dir)
-        
-    # 2. 状態の読み込み (Smart Scan)
+    # 日付フォルダ一覧 (Images 直下を1回だけ列挙)
+    images_root = DATA_DIR / "Images"
+    date_dirs = [p for p in inventory.subdirs(images_root) if re.match(r'^\d{8}$', p.name)]
+    if not date_dirs:
+        print(f"   [Info] 画像フォルダが見つかりません。")
+        return 0
+
+    # 1. 状態の読み込み (Smart Scan)
     state_file = DATA_DIR / "System" / "organizer_state.json"
-    last_full_scan = 0
-    folder_counts = {}
-    
+    state = {}
     if state_file.exists():
         try:
             with open(state_file, 'r') as f:
                 state = json.load(f)
-                last_full_scan = state.get('last_full_scan_ts', 0)
-                folder_counts = state.get('folder_counts', {})
         except Exception: pass
-        
-    last_full_scan_date = datetime.fromtimestamp(last_full_scan).date()
-    current_date = now.date()
-    is_full_scan = current_date > last_full_scan_date
-    
-    if is_full_scan:
-        print(f"   [Info] 本日最初の実行（または前回から日が経過）のため、全フォルダを検査します。")
-        images_root = DATA_DIR / "Images"
-        if images_root.exists():
-            skipped_folders = 0
-            for p in images_root.glob("*"):
-                if p.is_dir() and re.match(r'^\d{8}$', p.name):
-                    # 今日のフォルダは常にスキャン
-                    if p == today_dir:
-                        scan_targets.append(p)
-                        continue
-                    
-                    # ファイル数（拡張子問わず）に変化があるかチェック
-                    current_count = len(list(p.glob("*")))
-                    if folder_counts.get(p.name) == current_count:
-                        skipped_folders += 1
-                        continue
-                        
-                    scan_targets.append(p)
-            
-            if skipped_folders > 0:
-                print(f"   [Info] {skipped_folders} フォルダは変更がないためスキップされました。")
-    else:
-        print(f"   [Info] 本日は既に全検査済みのため、本日のフォルダのみを対象にします。")
-        if today_dir.exists():
-            scan_targets.append(today_dir)
-
-    # 状態の更新準備
-    new_folder_counts = folder_counts.copy()
-    images_root = DATA_DIR / "Images"
-    if images_root.exists():
-        for p in images_root.glob("*"):
-            if p.is_dir() and re.match(r'^\d{8}$', p.name):
-                new_folder_counts[p.name] = len(list(p.glob("*")))
-
-    try:
-        (DATA_DIR / "System").mkdir(parents=True, exist_ok=True)
-        with open(state_file, 'w') as f:
-            json.dump({
-                'last_full_scan_ts': now.timestamp(),
-                'folder_counts': new_folder_counts
-            }, f)
-    except Exception: pass
+    fingerprints = state.get('folder_fingerprints', {})
 
+    # 2. フォルダの指紋 (mtime + 全ファイルの名前・サイズ・mtime) が前回と異なるフォルダのみ検査
+    scan_targets = []
+    for p in date_dirs:
+        if fingerprints.get(p.name) != inventory.fingerprint(p):
+            scan_targets.append(p)
+    # 類似画像の検索は、前回の比較 (dry-run を除く) 以降に変更のあったフォルダの画像を起点にする (閾値の変更時は全フォルダ)
+    similar_targets = []
+    if SIMILAR_MODE:
+        similar_fingerprints = state.get('similar_fingerprints', {})
+        if state.get('similar_threshold') != SIMILAR_THRESHOLD: similar_fingerprints = {}
+        similar_targets = [p for p in date_dirs if similar_fingerprints.get(p.name) != inventory.fingerprint(p)]
+    skipped_folders = len(date_dirs) - len(scan_targets)
+    if skipped_folders > 0:
+        print(f"   [Info] {skipped_folders} フォルダは変更がないためスキップされました。")
     if not scan_targets:
-        print(f"   [Info] 画像フォルダが見つかりません。")
-        return 0
+        print(f"   [Info] 変更のあるフォルダはありません。")
+        if not similar_targets: return 0
 
     # 対象ファイル収集
     all_image_files = []
     # フォルダ数が多い場合は詳細表示を省略
     if len(scan_targets) > 5:
         print(f"   [Search] {len(scan_targets)} フォルダを対象に画像を検索中...")
-    else:
+    elif scan_targets:
         folder_names = ", ".join([d.name for d in scan_targets])
         print(f"   [Search] 検査対象: {folder_names}")
 
     for target_dir in scan_targets:
-        for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
-            all_image_files.extend(list(target_dir.glob(ext)))
+        all_image_files.extend(inventory.files(target_dir, IMAGE_EXTS))
 
     total_images = len(all_image_files)
-    print(f"   [Info] 検査対象: {total_images} 件の画像")
+    if scan_targets:
+        print(f"   [Info] 検査対象: {total_images} 件の画像")
+    probe_stats = ProbeStats()
+    cache_hits = 0
+    verdict_cache = VerdictCache(DATA_DIR / "System" / VERDICT_CACHE_FILE, DATA_DIR)
+    executor = WorkerPool()  # 検査・ハッシュ計算が必要なファイルが多い場合のみプロセスを起動する
+    similar_checked = False
 
-    for i, file_path in enumerate(all_image_files, 1):
-        if i % 20 == 0:
-            print(f"\r   [Processing] 画像検査進行中... ({i}/{total_images})", end="", flush=True)
-        try:
-            # 除外フォルダチェック
-            if any(p in file_path.parts for p in ["System", "Prompts"]):
-                continue
-            
-            should_remove = False
-            reason = ""
+    try:
+        # 事前判定: キャッシュとファイルサイズで判定できないファイルを洗い出す
+        entries, probe_targets = [], []
+        for file_path in all_image_files:
+            try:
+                # 除外フォルダチェック
+                if any(p in file_path.parts for p in ["System", "Prompts"]):
+                    continue
 
-            if file_path.name.endswith("profile-picture.webp"):
-                should_remove, reason = True, "User Profile Picture"
-            
-            # 1. Check file size (Delete if < 100KB)
-            if not should_remove:
-                file_size_kb = file_path.stat().st_size / 1024
-                if file_size_kb < 100:
-                    should_remove = True
-                    reason = f"File size too small: {file_size_kb:.1f}KB"
-
-            if not should_remove:
-                with Image.open(file_path) as img:
-                    width, height = img.size
-                    
-                    # 2. Check resolution (Delete if min dimension < 500px)
-                    if min(width, height) < 500:
+                # 変更のないファイルはキャッシュ済みの判定結果を使う
+                st = inventory.stat(file_path)
+                cached = verdict_cache.get_probe(file_path, st.st_size, st.st_mtime_ns)
+                if cached:
+                    cache_hits += 1
+                    if cached[3] == KEEP: continue
+                entries.append((file_path, st, cached))
+                if (not cached and not file_path.name.endswith("profile-picture.webp")
+                        and st.st_size / 1024 >= MIN_FILE_SIZE_KB):
+                    probe_targets.append(file_path)
+            except Exception:
+                pass
+
+        # ヘッダー解析 (未対応形式のみ Pillow で開く / ワーカー数に応じて並列実行)
+        probe_results = {}
+        total_probe = len(probe_targets)
+        for i, (file_path, probed) in enumerate(zip(probe_targets, probe_many(probe_targets, probe_stats, executor)), 1):
+            if i % 20 == 0:
+                print(f"\r   [Processing] 画像検査進行中... ({i}/{total_probe})", end="", flush=True)
+            probe_results[file_path] = probed
+
+        # 判定と削除 (削除はメインプロセスのみで行う)
+        for file_path, st, cached in entries:
+            try:
+                should_remove = False
+                reason = ""
+
+                if file_path.name.endswith("profile-picture.webp"):
+                    should_remove, reason = True, "User Profile Picture"
+                
+                # 1. Check file size (Delete if < 100KB)
+                if not should_remove:
+                    file_size_kb = st.st_size / 1024
+                    if file_size_kb < MIN_FILE_SIZE_KB:
                         should_remove = True
-                        reason = f"Small resolution: {width}x{height}"
-                    
-                    elif img.mode in ('RGBA', 'CMYK'):
-                        should_remove, reason = True, f"Mode: {img.mode}"
-            
-            if should_remove:
-                print(f"\r   🗑️ [削除] {file_path.name} ({reason})", flush=True)
-                os.remove(file_path)
-                count += 1
-        except Exception:
-            pass
-    
-    print() # Progress bar cleanup
-    print(f"   [OK] 処理完了")
-    
-    # 3. Duplicate Check
-    if scan_targets:
-        remove_content_duplicates(scan_targets, fav_set)
+                        reason = f"File size too small: {file_size_kb:.1f}KB"
+
+                probed = None
+                if not should_remove:
+                    if cached:
+                        probed = cached[:3] if cached[0] is not None else None
+                    else:
+                        probed = probe_results.get(file_path)
+                    if probed:
+                        width, height, mode = probed
+
+                        # 2. Check resolution (Delete if min dimension < 500px)
+                        if min(width, height) < MIN_RESOLUTION:
+                            should_remove = True
+                            reason = f"Small resolution: {width}x{height}"
+                        
+                        elif mode in ('RGBA', 'CMYK'):
+                            should_remove, reason = True, f"Mode: {mode}"
+
+                if not cached:
+                    verdict_cache.set_probe(file_path, st.st_size, st.st_mtime_ns, probed,
+                                            DELETE if should_remove else KEEP)
+                
+                if should_remove:
+                    print(f"\r   🗑️ [削除] {file_path.name} ({reason})", flush=True)
+                    os.remove(file_path)
+                    inventory.discard(file_path)
+                    verdict_cache.discard(file_path)
+                    count += 1
+            except Exception:
+                pass
+        
+        # 3. Duplicate Check
+        if scan_targets:
+            print() # Progress bar cleanup
+            print(f"   [Probe] {probe_stats.summary()} / キャッシュ: {cache_hits} 件")
+            print(f"   [OK] 処理完了")
+            remove_content_duplicates(scan_targets, fav_set, verdict_cache, executor, inventory)
+
+        # 類似画像の削除 (指定時のみ)。削除で指紋が変わったフォルダは次回の検査対象になる
+        if similar_targets:
+            removed = remove_similar_images(date_dirs, similar_targets, fav_set, verdict_cache, executor, inventory)
+            if removed is not None:
+                count += removed
+                similar_checked = not SIMILAR_DRY_RUN
+
+        # 4. 消えたファイル・フォルダのキャッシュを削除
+        existing_names = {}
+        for file_path in all_image_files:
+            existing_names.setdefault(file_path.parent, set()).add(file_path.name)
+        for target_dir in scan_targets:
+            verdict_cache.prune_folder(target_dir, existing_names.get(target_dir, set()))
+        verdict_cache.prune_folders(date_dirs)
+        verdict_cache.save()
+    finally:
+        verdict_cache.close()
+        executor.shutdown()
+
+    # 5. 状態の更新 (削除後のフォルダの指紋を記録。消えたフォルダは除外)
+    new_fingerprints = {p.name: fingerprints[p.name] for p in date_dirs if p.name in fingerprints}
+    for p in scan_targets:
+        fp = inventory.fingerprint(p)
+        if fp is not None: new_fingerprints[p.name] = fp
+    state['folder_fingerprints'] = new_fingerprints
+    if similar_checked:
+        state['similar_threshold'] = SIMILAR_THRESHOLD
+        state['similar_fingerprints'] = {p.name: inventory.fingerprint(p) for p in date_dirs}
+    try:
+        (DATA_DIR / "System").mkdir(parents=True, exist_ok=True)
+        write_json_atomic(state_file, state)
+    except Exception: pass
         
     return count
 
-def organize_prompts():
-    """プロンプトのマージ処理 (連続重複のみ排除)"""
+def organize_prompts(inventory=None):
+    """プロンプトのマージ処理 (連続重複のみ排除)
+
+    新規ファイルのみ解析し、マージ済みファイル (新しい順) と逐次マージする。
+    新規分を書き終えた時点で、残りの履歴は解析せずそのままコピーする。
+    """
+    from prompt_reader import MERGED_HEADER, iter_prompts, read_prompts
     print(f"\n [Prompts] プロンプト整理処理開始...")
+    if inventory is None: inventory = Inventory()
 
     prompts_dir = DATA_DIR / "Prompts"
     if not prompts_dir.exists(): return 0
     archive_dir = prompts_dir / "Archived"
     archive_dir.mkdir(exist_ok=True)
 
-    txt_files = list(prompts_dir.glob("*.txt"))
-    all_prompts = []
-    prompt_pattern = re.compile(r'^\[(\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2}:\d{2})\]\s*\n(.*?)(?=\n-{20,}|\Z)', re.DOTALL | re.MULTILINE)
+    txt_files = inventory.files(prompts_dir, (".txt",))
+    new_prompts = []
     files_to_archive = []
 
-    # 1. 各ファイルおよび既存マージファイルから全読み込み
-    # globは再帰的ではないため、直下のファイルのみ取得する (Archivedフォルダの中身は対象外)
+    # 1. 新規ファイルのみ読み込み (Archivedフォルダの中身は対象外)
     source_files = [p for p in txt_files if p.name != MERGED_PROMPT_FILE]
-    
-    # 既存のマージファイルを読み込み対象に追加
-    merged_file_path = prompts_dir / MERGED_PROMPT_FILE
-    all_files_to_read = source_files.copy()
-    if merged_file_path.exists():
-        all_files_to_read.append(merged_file_path)
+    merged_path = prompts_dir / MERGED_PROMPT_FILE
 
     print(f"   [Info] 処理対象ファイル: {len(source_files)}件 (新規)")
     
-    for i, txt_path in enumerate(all_files_to_read, 1):
+    for i, txt_path in enumerate(source_files, 1):
         if i % 5 == 0:
-            print(f"\r   [Processing] プロンプト読み込み中... ({i}/{len(all_files_to_read)})", end="", flush=True)
+            print(f"\r   [Processing] プロンプト読み込み中... ({i}/{len(source_files)})", end="", flush=True)
         try:
-            with open(txt_path, "r", encoding="utf-8-sig") as f:
-                content = f.read()
-            found = False
-            for match in prompt_pattern.finditer(content):
-                found = True
-                dt_str, text = match.group(1), match.group(2).strip()
-                try:
-                    dt = datetime.strptime(dt_str, '%Y/%m/%d %H:%M:%S')
-                    all_prompts.append({'time': dt.timestamp(), 'date_str': dt_str, 'content': text})
-                except ValueError: continue
-            
-            # ソースファイル（＝新規ファイル）のみアーカイブ対象にする
-            if found and txt_path.name != MERGED_PROMPT_FILE:
-                files_to_archive.append(txt_path)
-        except Exception: pass
+            prompts = list(read_prompts(txt_path))
+        except OSError: continue
+        new_prompts.extend(prompts)
+        if prompts: files_to_archive.append(txt_path)
 
-    if all_prompts:
-        # 新しい順にソート
-        all_prompts.sort(key=lambda x: x['time'], reverse=True)
-        final_list = []
-        for p in all_prompts:
-            if not final_list:
-                final_list.append(p)
-            else:
-                # 全く同じ内容が連続した場合のみ排除
-                if p['content'] != final_list[-1]['content']:
-                    final_list.append(p)
-        
+    if new_prompts:
+        # 新しい順にソート (同時刻はファイル順を維持)
+        new_prompts.sort(key=lambda x: x.time, reverse=True)
+        copied = 0
         try:
-            merged_path = prompts_dir / MERGED_PROMPT_FILE
-            with open(merged_path, "w", encoding="utf-8") as f:
-                f.write("GrokSaver Prompt History (Merged)\n====================================\n\n")
-                for item in final_list:
-                    f.write(f"[{item['date_str']}]\n{item['content']}\n------------------------------------\n\n")
+            tmp_path = merged_path.with_name(merged_path.name + ".tmp")
+            history = open(merged_path, "rb") if inventory.exists(merged_path) else None
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as out:
+                    out.write(MERGED_HEADER)
+                    last = None
+
+                    def emit(content, date_str):
+                        nonlocal last
+                        # 全く同じ内容が連続した場合のみ排除
+                        if content == last: return
+                        out.write(f"[{date_str}]\n{content}\n------------------------------------\n\n")
+                        last = content
+
+                    entries = iter_prompts(history) if history else iter(())
+                    head = next(entries, None)
+                    for prompt in new_prompts:
+                        # 同時刻の場合は新規分を先に出力 (従来の全件ソートと同じ順序)
+                        while head is not None and head.time > prompt.time:
+                            emit(head.content, head.date_str)
+                            head = next(entries, None)
+                        emit(prompt.content, prompt.date_str)
+                    if head is not None and head.content == last:
+                        head = next(entries, None)
+                    if head is not None:
+                        # 残りの履歴は整列・重複排除済みのため、そのままコピー
+                        entries.close()
+                        history.seek(head.offset)
+                        out.flush()
+                        start = out.buffer.tell()
+                        shutil.copyfileobj(history, out.buffer)
+                        copied = out.buffer.tell() - start
+            finally:
+                if history: history.close()
+            os.replace(tmp_path, merged_path)
+            inventory.add(merged_path)
+            print(f"\r   [Info] {len(new_prompts)} 件を履歴にマージ (既存履歴 {copied / 1024:.0f}KB はコピーのみ)")
             
             # 1世代残しロジック: 新しいファイルをアーカイブする前に、既存のアーカイブを全削除
             if files_to_archive:
                 print(f"   🧹 アーカイブの旧世代ファイルを削除中...")
-                for old_file in archive_dir.glob("*"):
+                for old_file in inventory.files(archive_dir):
                     try:
-                        if old_file.is_file(): os.remove(old_file)
+                        os.remove(old_file)
+                        inventory.discard(old_file)
                     except Exception: pass
 
                 for src in files_to_archive:
-                    try: shutil.move(str(src), str(archive_dir / src.name))
+                    try:
+                        shutil.move(str(src), str(archive_dir / src.name))
+                        inventory.move(src, archive_dir / src.name)
                     except Exception: pass
         except Exception: pass
     print() # Progress bar cleanup
-    return len(all_prompts)
+    return len(new_prompts)
 
-def organize_favorites():
-    """Favoritesログの統合"""
+def organize_favorites(inventory=None):
+    """Favoritesログの統合 (ストアに追加し、Favoritesのファイル名の集合を返す)"""
+    from favorites_store import parse_log_items
     print(f"\n [Favorites] Favoritesログ整理処理開始...")
+    if inventory is None: inventory = Inventory()
     logs_dir = DATA_DIR / "System" / "FavLogs"
-    if not logs_dir.exists(): return set()
-    archive_dir, system_dir = logs_dir / "Archived", DATA_DIR / "System"
-    archive_dir.mkdir(parents=True, exist_ok=True)
-    merged_db_path, favorites_set = system_dir / FAVORITES_DB_FILE, set()
-    
-    if merged_db_path.exists():
-        try:
-            with open(merged_db_path, "r", encoding="utf-8") as f:
-                for item in json.load(f): favorites_set.add(item['filename'])
-        except Exception: pass
+    store = open_favorites_store()
+    try:
+        if logs_dir.exists():
+            archive_dir = logs_dir / "Archived"
+            archive_dir.mkdir(parents=True, exist_ok=True)
 
-    log_files = list(logs_dir.glob("*.json"))
-    files_to_archive = []
-    for log_file in log_files:
-        try:
-            with open(log_file, "r", encoding="utf-8") as f:
-                items = json.load(f)
-                if isinstance(items, list):
-                    for item in items:
-                        if item.get('filename'): favorites_set.add(item['filename'])
-                elif isinstance(items, dict) and items.get('filename'):
-                    favorites_set.add(items['filename'])
-            files_to_archive.append(log_file)
-        except Exception: pass
+            log_files = inventory.files(logs_dir, (".json",))
+            items, files_to_archive = [], []
+            for log_file in log_files:
+                try:
+                    with open(log_file, "r", encoding="utf-8") as f:
+                        items.extend(parse_log_items(json.load(f)))
+                    files_to_archive.append(log_file)
+                except Exception: pass
 
-    if log_files or not merged_db_path.exists():
-        save_list = [{"filename": name} for name in favorites_set]
-        system_dir.mkdir(parents=True, exist_ok=True)
-        with open(merged_db_path, "w", encoding="utf-8") as f:
-            json.dump(save_list, f, indent=2, ensure_ascii=False)
-        
-        # 1世代残しロジック: 新しいファイルをアーカイブする前に、既存のアーカイブを全削除
-        if files_to_archive:
-           for old_file in archive_dir.glob("*"):
-               try:
-                   if old_file.is_file(): os.remove(old_file)
-               except Exception: pass
-
-           for src in files_to_archive:
-               try: shutil.move(str(src), str(archive_dir / src.name))
-               except Exception: pass
+            # 全ログの内容を1トランザクションで追加 (書き込みが完了してからアーカイブする)
+            if items:
+                added = store.add_many(items)
+                print(f"   [OK] {len(files_to_archive)} 件のログから {added} 件のFavoritesを追加しました。")
+
+            # 1世代残しロジック: 新しいファイルをアーカイブする前に、既存のアーカイブを全削除
+            if files_to_archive:
+               for old_file in inventory.files(archive_dir):
+                   try:
+                       os.remove(old_file)
+                       inventory.discard(old_file)
+                   except Exception: pass
+
+               for src in files_to_archive:
+                   try:
+                       shutil.move(str(src), str(archive_dir / src.name))
+                       inventory.move(src, archive_dir / src.name)
+                   except Exception: pass
+        favorites_set = store.filenames()
+    finally:
+        store.close()
     return favorites_set
 
-def get_file_info(path, type_label, fav_set):
-    ts = path.stat().st_mtime
-    match = re.search(r'_(\d{8})_(\d{6})_', path.name)
+_hour_starts = {}  # (年, 月, 日, 時) -> その時刻 (ローカル時刻) の UNIX秒
+
+def _hour_start(year, month, day, hour):
+    key = (year, month, day, hour)
+    ts = _hour_starts.get(key)
+    if ts is None:
+        # 夏時間の切り替えは時単位のため、ローカル時刻の変換は時ごとに1回でよい
+        ts = _hour_starts[key] = datetime(year, month, day, hour).timestamp()
+    return ts
+
+_file_timestamps = {}  # (ファイル名, mtime) -> 日時
+FILE_TIMESTAMP_CACHE_MAX = 1 << 16
+
+def get_file_timestamp(name, mtime):
+    """ファイル名の日時 (_YYYYMMDD_HHMMSS_) を優先し、なければ (日時として正しくない場合も) mtime を返す
+
+    数字の切り出しと整数演算で求め、結果は (ファイル名, mtime) ごとに記憶する。
+    """
+    key = (name, mtime)
+    ts = _file_timestamps.get(key)
+    if ts is not None: return ts
+    ts = mtime
+    match = FILE_STAMP_RE.search(name)
     if match:
+        date, clock = match.group(1), match.group(2)
+        minute, second = int(clock[2:4]), int(clock[4:])
+        if minute < 60 and second < 60:
+            try:
+                ts = _hour_start(int(date[:4]), int(date[4:6]), int(date[6:]), int(clock[:2])) + minute * 60 + second
+            except ValueError: pass  # 13月・25時など
+    if len(_file_timestamps) >= FILE_TIMESTAMP_CACHE_MAX: _file_timestamps.clear()
+    _file_timestamps[key] = ts
+    return ts
+
+def index_videos(inventory=None):
+    """動画の長さ・解像度・作成日時を MP4 のヘッダーから取得し、カタログに保存する (未解析・変更された動画のみ)"""
+    from media_catalog import MediaCatalog, CATALOG_FILE
+    from video_probe import probe_mp4
+    print(f"\n [Videos] 動画情報の取得開始...")
+    if not DATA_DIR.exists(): return 0
+    system_dir = DATA_DIR / "System"
+    system_dir.mkdir(parents=True, exist_ok=True)
+    catalog = MediaCatalog(system_dir / CATALOG_FILE)
+    try:
+        catalog.reconcile(DATA_DIR, GROK_ROOT_DIR, get_file_timestamp, inventory)
+        probed, failed = catalog.index_videos(GROK_ROOT_DIR, probe_mp4)
+    finally:
+        catalog.close()
+    if probed:
+        print(f"   [Info] 動画情報: {probed} 件解析" + (f" (解析できない動画: {failed} 件)" if failed else ""))
+    else:
+        print("   [Info] 新しい動画はありません。")
+    return probed
+
+def refresh_media_catalog(fav_set, inventory=None):
+    """カタログ (SQLite) を差分更新し (変更のあったフォルダのみ再走査)、Favoritesフラグを反映する。メディア件数を返す"""
+    from media_catalog import MediaCatalog, CATALOG_FILE
+    if not DATA_DIR.exists(): return 0
+    system_dir = DATA_DIR / "System"
+    system_dir.mkdir(parents=True, exist_ok=True)
+    catalog = MediaCatalog(system_dir / CATALOG_FILE)
+    try:
+        rescanned = catalog.reconcile(DATA_DIR, GROK_ROOT_DIR, get_file_timestamp, inventory)
+        catalog.sync_favorites(fav_set)
+        count = catalog.count()
+    finally:
+        catalog.close()
+    print(f"   [Info] ビューアー用データ収集: {count} ファイル (再走査: {rescanned} フォルダ)")
+    return count
+
+def group_day(date_key, items, links, prompts):
+    """1日分のメディア (新しい順) をグループのリストにまとめる"""
+    grouped_list = []
+
+    # Extract favorites for this specific date
+    days_favorites = [item for item in items if item.get('is_favorite')]
+
+    # Add "Day's Favorites" to the top of this date's section if any exist
+    if days_favorites:
+        # Create a fake prompt object for the header
+        fav_prompt = {
+            'type': 'prompt',
+            'name': 'System',
+            'time': days_favorites[0]['time'] + 0.1, # Slightly newer than latest favorite to act as header
+            'date_str': date_key,
+            'content': "⭐ Favorites", # Simple header, as it's already under the date section
+            'is_favorite': True
+        }
+        grouped_list.append({"prompt": fav_prompt, "media": days_favorites})
+
+    # 対応するプロンプトが同じメディアをまとめる (プロンプトは前日のものでもよい。対応するプロンプトがないメディアは prompt: None)
+    current_key, current_group = None, None
+    for item in items:
+        # Skip items that are already in favorites to prevent duplication
+        if item.get('is_favorite'):
+            continue
+        key = links.get(item['path'])
+        if current_group is None or key != current_key:
+            current_key, current_group = key, {"prompt": prompts.get(key), "media": []}
+            grouped_list.append(current_group)
+        current_group['media'].append(item)
+    return grouped_list
+
+def collect_and_group_data(thumbs=None):
+    """カタログを日付ごとに読み、(日付, グループのリスト) を新しい日付から順に返す
+
+    1日分ずつ作成して返すため、全メディア・タイムライン全体はメモリに保持しない (refresh_media_catalog の後に使う)。
+    プロンプトは日時とファイル上の位置のみを保持し、本文はその日のメディアに対応付いたものだけを読み込む。
+    thumbs: {元画像の相対パス: サムネイルの相対パス}
+    """
+    from media_catalog import MediaCatalog, CATALOG_FILE
+    from prompt_links import PromptLinker
+    from prompt_reader import read_prompts, read_prompt_at
+    thumbs = thumbs or {}
+
+    # 統合済みのプロンプト履歴を1件ずつ読み、日時と位置を索引する。同時刻のプロンプトは履歴の先頭 (新しい側) を使う
+    merged_path = DATA_DIR / "Prompts" / MERGED_PROMPT_FILE
+    offsets = {}
+    for prompt in read_prompts(merged_path):
+        if not prompt.content or prompt.time in offsets: continue
+        offsets[prompt.time] = prompt.offset
+    try:
+        history = open(merged_path, "rb") if offsets else None
+    except OSError:
+        history, offsets = None, {}
+
+    def load_prompts(links):
+        """対応付いたプロンプトの本文をファイル上の順に読み込む"""
+        prompts = {}
+        for ts in sorted({ts for ts in links.values() if ts in offsets}, key=offsets.get):
+            prompt = read_prompt_at(history, offsets[ts])
+            if prompt is not None:
+                prompts[ts] = {'type': 'prompt', 'name': "History", 'time': prompt.time, 'date_str': prompt.day, 'content': prompt.content, 'is_favorite': False}
+        return prompts
+
+    catalog = MediaCatalog(DATA_DIR / "System" / CATALOG_FILE)
+    try:
+        # プロンプトとの対応付け (日時の二分探索)。前回から変わったメディア・プロンプトの周辺のみ対応付け直す
+        linker = PromptLinker(catalog.conn, offsets.keys(), PROMPT_WINDOW_SEC, PROMPT_LATE_SEC)
+        for date_key in catalog.days():
+            items = []
+            for relpath, name, type_label, ts, is_fav, duration, width, height in catalog.iter_day(date_key):
+                item = {
+                    'type': type_label, 'name': name, 'time': ts,
+                    'date_str': date_key,
+                    'path': relpath, 'is_favorite': bool(is_fav)
+                }
+                if type_label == 'video':
+                    item.update(duration=duration, width=width, height=height)
+                elif relpath in thumbs:
+                    item['thumb'] = thumbs[relpath]
+                items.append(item)
+            links = linker.link([(m['path'], m['time']) for m in items])
+            yield date_key, group_day(date_key, items, links, load_prompts(links))
+        relinked = linker.finish()
+        if relinked:
+            print(f"   [Info] プロンプトの対応付け: {relinked} 件更新")
+    finally:
+        catalog.close()
+        if history: history.close()
+
+def generate_thumbnails():
+    """ビューアー一覧用のサムネイルを差分生成し、{元画像の相対パス: サムネイルの相対パス} を返す"""
+    from media_catalog import MediaCatalog, CATALOG_FILE
+    from thumbnails import ThumbnailCache, make_thumbnail, pillow_available
+    catalog = MediaCatalog(DATA_DIR / "System" / CATALOG_FILE)
+    try:
+        sources = list(catalog.iter_files("image"))
+    finally:
+        catalog.close()
+
+    cache = ThumbnailCache(GROK_ROOT_DIR, THUMB_DIR)
+    try:
+        jobs, ready = cache.plan(sources)
+        if jobs and not pillow_available():
+            print("   [Info] Pillowライブラリがないため、サムネイル生成をスキップします。")
+            jobs = []
+
+        created = 0
+        executor = create_worker_pool(len(jobs))
         try:
-            dt_str = match.group(1) + match.group(2)
-            dt = datetime.strptime(dt_str, '%Y%m%dH%M%S')
-            ts = dt.timestamp()
-        except ValueError: pass
-    return {
-        'type': type_label, 'name': path.name, 'time': ts,
-        'date_str': datetime.fromtimestamp(ts).strftime('%Y-%m-%d'), 
-        'path': os.path.relpath(path, GROK_ROOT_DIR).replace("\\", "/"),
-        'is_favorite': path.name in fav_set or type_label == 'video'
-    }
-
-def collect_and_group_data(fav_set):
-    if not DATA_DIR.exists(): return {}
-    all_items, media_files = [], []
-    for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp", "*.mp4"]:
-        media_files.extend(list(DATA_DIR.rglob(ext)))
-
-    total_media = len(media_files)
-    print(f"   [Info] ビューアー用データ収集: {total_media} ファイル")
-
-    for i, path in enumerate(media_files, 1):
-        if i % 50 == 0:
-             print(f"\r   [Processing] データ収集中... ({i}/{total_media})", end="", flush=True)
-        if path.parent.name in ["Prompts", "System", "Organizer", "ChromeExtension", "icons"]: continue
-        if path.parent.parent.name == "System": continue # Prevent FavLogs/Archived
-        if "Organizer" in path.parts or "_App" in path.parts: continue
-        all_items.append(get_file_info(path, 'video' if path.suffix.lower() == '.mp4' else 'image', fav_set))
-
-    merged_file = DATA_DIR / "Prompts" / MERGED_PROMPT_FILE
-    if merged_file.exists():
-        prompt_pattern = re.compile(r'^\[(\d{4}/\d{1,2}/\d{1,2} \d{1,2}:\d{2}:\d{2})\]\s*\n(.*?)(?=\n-{20,}|\Z)', re.DOTALL | re.MULTILINE)
+            job_args = [cache.job_args(job) for job in jobs]
+            results = executor.map(make_thumbnail, job_args, chunksize=4) if executor else map(make_thumbnail, job_args)
+            for i, (job, ok) in enumerate(zip(jobs, results), 1):
+                if i % 20 == 0:
+                    print(f"\r   [Processing] サムネイル生成中... ({i}/{len(jobs)})", end="", flush=True)
+                cache.record(job, ok)
+                if ok:
+                    ready.add(job[0])
+                    created += 1
+        finally:
+            if executor: executor.shutdown()
+
+        removed = cache.collect_garbage({relpath for relpath, _, _ in sources})
+        if jobs: print()
+        print(f"   [Thumbs] {created} 件生成 / {removed} 件削除 / 合計 {len(ready)} 件")
+        return {relpath: cache.url(relpath) for relpath in ready}
+    finally:
+        cache.close()
+
+def write_viewer_data(days_iter):
+    """日付ごとのデータファイルと日付一覧 (index.js)・検索インデックスを出力する。内容が変わらない日付は書き換えない
+
+    days_iter は (日付, グループのリスト) を新しい日付から順に返す (collect_and_group_data)。
+    1日分ずつ書き出して破棄し、各ファイルは一時ファイルに逐次書き出してから置き換える。
+    """
+    from search_index import SearchIndexBuilder
+    from viewer_payload import encode_day
+    VIEWER_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    manifest_path = VIEWER_DATA_DIR / "manifest.json"
+    manifest = {}
+    if manifest_path.exists():
         try:
-            with open(merged_file, "r", encoding="utf-8") as f:
-                content = f.read()
-            for match in prompt_pattern.finditer(content):
-                dt_str, text = match.group(1), match.group(2).strip()
-                if not text: continue
-                dt = datetime.strptime(dt_str, '%Y/%m/%d %H:%M:%S')
-                all_items.append({'type': 'prompt', 'name': "History", 'time': dt.timestamp(), 'date_str': dt.strftime('%Y-%m-%d'), 'content': text, 'is_favorite': False})
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
         except Exception: pass
+    old_days = manifest.get("days", {})
 
-    date_buckets = {}
-    for item in all_items:
-        date_key = item['date_str']
-        date_buckets.setdefault(date_key, []).append(item)
+    days, written = {}, 0
+    # 日付一覧: サイドバーの件数表示に必要な集計値のみ (メディア本体は含まない)
+    index = {"dates": [], "days": {}}
+    search = SearchIndexBuilder()
+    for date, groups in days_iter:
+        # 列形式 (フォルダの共通化・項目ごとの配列・フラグ・整数の日時) で、列ごとに書き出す
+        with AtomicWriter(VIEWER_DATA_DIR / f"{date}.js", old_days.get(date)) as out:
+            out.write(f"grokViewerShard({json.dumps(date)}, ")
+            write_json_streamed(out, encode_day(groups))
+            out.write(");\n")
+        written += out.changed
+        days[date] = out.digest
+        all_count = sum(len(g['media']) for g in groups)
+        fav_count = sum(1 for g in groups for m in g['media'] if m.get('is_favorite'))
+        index["dates"].append(date)
+        index["days"][date] = {"v": out.digest, "all": all_count, "fav": fav_count}
+        search.add_day(date, groups)
 
-    timeline_data = {}
-    for date_key, items in date_buckets.items():
-        items.sort(key=lambda x: x['time'], reverse=True)
-        grouped_list, current_media_group = [], []
-        
-        # Extract favorites for this specific date
-        days_favorites = [item for item in items if item.get('is_favorite')]
-        
-        # Add "Day's Favorites" to the top of this date's section if any exist
-        if days_favorites:
-            # Sort favorites by time descending
-            days_favorites.sort(key=lambda x: x['time'], reverse=True)
-            
-            # Create a fake prompt object for the header
-            fav_prompt = {
-                'type': 'prompt',
-                'name': 'System',
-                'time': days_favorites[0]['time'] + 0.1, # Slightly newer than latest favorite to act as header
-                'date_str': date_key,
-                'content': "⭐ Favorites", # Simple header, as it's already under the date section
-                'is_favorite': True
-            }
-            grouped_list.append({"prompt": fav_prompt, "media": days_favorites})
-
-        for item in items:
-            # Skip items that are already in favorites to prevent duplication
-            if item.get('is_favorite'):
-                continue
+    # 消えた日付のデータを削除
+    for date in old_days:
+        if date not in days:
+            try: os.remove(VIEWER_DATA_DIR / f"{date}.js")
+            except OSError: pass
 
-            if item['type'] in ('image', 'video'):
-                current_media_group.append(item)
-            elif item['type'] == 'prompt':
-                if current_media_group:
-                    grouped_list.append({"prompt": item, "media": current_media_group})
-                    current_media_group = []
-        if current_media_group:
-            grouped_list.append({"prompt": None, "media": current_media_group})
-            
-        if grouped_list:
-            timeline_data[date_key] = grouped_list
-    print() # Progress bar cleanup
-    return timeline_data
+    # プロンプト検索用の転置インデックス (検索時のみ読み込む)。トークンごとに書き出す
+    with AtomicWriter(VIEWER_DATA_DIR / "search.js", manifest.get("search")) as out:
+        out.write("grokViewerSearch(")
+        search.write(out)
+        out.write(");\n")
+    index["search"] = out.digest
 
-def generate_viewer_html(fav_set):
+    with AtomicWriter(VIEWER_DATA_DIR / "index.js", manifest.get("index")) as out:
+        out.write("grokViewerIndex(")
+        write_json_streamed(out, index, depth=2)
+        out.write(");\n")
+    write_json_atomic(manifest_path, {"days": days, "index": out.digest, "search": index["search"]})
+    return written, len(days) - written
+
+def generate_viewer_html(fav_set, inventory=None, open_browser=True):
     """ご提示いただいた過去のコードのUIデザインを完全に復元したビューアーの生成"""
+    from search_index import CJK_RANGES
     print(f"\n [Viewer] ビューアー生成処理開始...")
-    data = collect_and_group_data(fav_set)
-    if not data:
+    if not refresh_media_catalog(fav_set, inventory):
         print("   ⚠️ 表示するデータが見つかりませんでした。")
         return
-    dates = sorted(list(data.keys()), reverse=True)
-    json_data = json.dumps(data, ensure_ascii=False)
-    dates_json = json.dumps(dates)
+    try:
+        thumbs = generate_thumbnails()
+    except Exception as e:
+        print(f"   ⚠️ [Error] サムネイル生成失敗: {e}")
+        thumbs = {}
+    try:
+        written, unchanged = write_viewer_data(collect_and_group_data(thumbs))
+        print(f"   [Info] 日付データ: {written} 件更新 / {unchanged} 件変更なし")
+    except Exception as e:
+        print(f"   [Error] 生成失敗: {e}")
+        return
+    viewer_data_url = os.path.relpath(VIEWER_DATA_DIR, GROK_ROOT_DIR).replace("\\", "/")
 
     html_content = f"""<!DOCTYPE html>
 <html lang="ja">
@@ -577,6 +975,8 @@ def generate_viewer_html(fav_set):
         .search-box {{ display: flex; gap: 5px; margin-bottom: 10px; }}
         #search-input {{ flex: 1; padding: 8px; border-radius: 4px; border: 1px solid #444; background: #333; color: white; min-width: 0; }}
         .search-btn {{ width: 36px; height: 36px; background: var(--accent); border: none; border-radius: 4px; color: #000; font-weight: bold; cursor: pointer; display: flex; align-items: center; justify-content: center; font-size: 1.2rem; }}
+        .search-range {{ display: flex; gap: 5px; align-items: center; margin-bottom: 10px; font-size: 0.8rem; color: #888; }}
+        .search-range input {{ flex: 1; min-width: 0; padding: 4px; border-radius: 4px; border: 1px solid #444; background: #333; color: white; color-scheme: dark; }}
         .back-btn {{ margin-top: auto; padding: 10px; background: none; border: 1px solid #555; color: #ccc; cursor: pointer; border-radius: 4px; }}
         .filter-tabs {{ display: flex; border-bottom: 1px solid var(--border); }}
         .filter-tab {{ flex: 1; padding: 10px; text-align: center; cursor: pointer; background: rgba(0,0,0,0.2); transition: background 0.2s; font-size: 0.9rem; }}
@@ -601,9 +1001,12 @@ def generate_viewer_html(fav_set):
         }}
         .prompt-copy-btn:hover {{ background: var(--accent); color: #000; }}
         .media-grid {{ display: grid; grid-template-columns: repeat(auto-fill, minmax(200px, 1fr)); gap: 10px; align-items: start; }}
+        .media-grid + .media-grid {{ margin-top: 10px; }}
         .media-item {{ background: #000; cursor: pointer; border-radius: 4px; overflow: hidden; position: relative; }}
         .media-item img, .media-item video {{ width: 100%; height: auto; display: block; transition: transform 0.2s; }}
         .media-item:hover img {{ transform: scale(1.02); }}
+        .video-poster {{ position: relative; width: 100%; background: #1a1a1a; display: flex; align-items: center; justify-content: center; color: #555; font-size: 2rem; }}
+        .media-item .video-poster video {{ position: absolute; top: 0; left: 0; width: 100%; height: 100%; object-fit: contain; }}
 
         .media-item.selected {{ outline: 3px solid var(--accent); z-index: 5; }}
         #modal {{ display: none; position: fixed; top: 0; left: 0; width: 100%; height: 100%; background: rgba(0,0,0,0.9); z-index: 1000; justify-content: center; align-items: center; }}
@@ -644,6 +1047,7 @@ def generate_viewer_html(fav_set):
         </div>
         <div id="search-sidebar-content" class="hidden">
             <div class="search-box"><input type="text" id="search-input" placeholder="検索..." onkeydown="if(event.key==='Enter') performSearch()"><button class="search-btn" onclick="performSearch()">&#128269;</button></div>
+            <div class="search-range"><input type="date" id="search-from" title="開始日"><span>〜</span><input type="date" id="search-to" title="終了日"></div>
             <div id="search-status">キーワードを入力</div><button class="back-btn" onclick="toggleSearchMode()">← 戻る</button>
         </div>
         <div id="nav-buttons"><button class="nav-btn" onclick="scrollToTop()">▲</button><button class="nav-btn" onclick="scrollToBottom()">▼</button><button class="nav-btn" onclick="scrollGroup('prev')">↑</button><button class="nav-btn" onclick="scrollGroup('next')">↓</button></div>
@@ -657,32 +1061,128 @@ def generate_viewer_html(fav_set):
         <div id="modal-content" onclick="event.stopPropagation()"></div>
     </div>
     <script>
-        const data = {json_data}; const dates = {dates_json};
+        // データは日付ごとに分割された外部スクリプト (file:// でも読み込み可能) から必要な時だけ読み込む
+        const VIEWER_DATA = '{viewer_data_url}';
+        const data = {{}}, loadingDays = {{}}; let dates = [], dayIndex = {{}}, searchVersion = '';
+        function grokViewerIndex(index) {{ dates = index.dates; dayIndex = index.days; searchVersion = index.search; }}
+        function grokViewerShard(date, s) {{
+            // 列形式 (viewer_payload.py) からグループのリストに展開する
+            const groups = []; let i = 0, v = 0, time = 0;
+            s.groups.forEach(([count, promptTime, content]) => {{
+                const media = [];
+                for (const end = i + count; i < end; i++) {{
+                    const d = s.dir[i], name = s.name[i], flags = s.flags[i]; time += s.time[i];
+                    const m = {{ type: flags & 1 ? 'video' : 'image', name, time, path: `${{s.dirs[d]}}/${{name}}`,
+                        thumb: flags & 4 ? `${{s.thumbDirs[d]}}/${{name}}.webp` : null, is_favorite: (flags & 2) !== 0 }};
+                    if (flags & 1) [m.duration, m.width, m.height] = s.videos[v++];
+                    media.push(m);
+                }}
+                groups.push({{ prompt: content === undefined ? null : {{ time: promptTime, content }}, media }});
+            }});
+            data[date] = groups;
+        }}
+        function loadScript(src) {{
+            return new Promise((resolve, reject) => {{
+                const s = document.createElement('script'); s.src = src;
+                s.onload = () => {{ s.remove(); resolve(); }}; s.onerror = () => {{ s.remove(); reject(new Error(src)); }};
+                document.head.appendChild(s);
+            }});
+        }}
+        function loadDay(date) {{
+            if (data[date]) return Promise.resolve();
+            if (!loadingDays[date]) loadingDays[date] = loadScript(`${{VIEWER_DATA}}/${{date}}.js?v=${{dayIndex[date].v}}`).catch(() => {{ delete loadingDays[date]; }});
+            return loadingDays[date];
+        }}
         let currentFilter = 'all', currentDate = null, isSearchMode = false, currentMediaList = [], currentMediaIndex = -1;
         let selectedIndices = new Set();
-        window.onload = () => {{ renderDateList(); if (dates.length > 0) selectDate(dates[0]); }};
+        window.onload = () => {{ loadScript(`${{VIEWER_DATA}}/index.js?t=${{Date.now()}}`).then(() => {{ renderDateList(); if (dates.length > 0) selectDate(dates[0]); }}); }};
         document.addEventListener('keydown', (e) => {{ if (document.getElementById('modal').classList.contains('active')) {{ if (e.key === 'Escape') closeModal(); if (e.key === 'ArrowLeft') navigateModal(-1); if (e.key === 'ArrowRight') navigateModal(1); }} }});
         function toggleSearchMode() {{ isSearchMode = !isSearchMode; document.getElementById('normal-sidebar-content').classList.toggle('hidden', isSearchMode); document.getElementById('search-sidebar-content').classList.toggle('hidden', !isSearchMode); if (isSearchMode) document.getElementById('search-input').focus(); }}
         function setFilter(f) {{ currentFilter = f; document.querySelectorAll('.filter-tab').forEach(el => el.classList.remove('active')); document.querySelector(`.filter-tab[onclick="setFilter('${{f}}')"]`).classList.add('active'); renderDateList(); if (currentDate) selectDate(currentDate); }}
         function renderDateList() {{
             const list = document.getElementById('date-list'); list.innerHTML = '';
             dates.forEach(date => {{
-                let count = 0; data[date].forEach(g => count += g.media.filter(m => currentFilter === 'all' || m.is_favorite).length);
+                const count = currentFilter === 'all' ? dayIndex[date].all : dayIndex[date].fav;
                 if (count === 0 && currentFilter === 'fav') return;
                 const li = document.createElement('li'); li.className = 'date-item' + (date === currentDate ? ' active' : ''); li.onclick = () => selectDate(date);
                 li.id = 'date-' + date; li.innerHTML = `${{date}} <span class="count">${{count}}</span>`; list.appendChild(li);
             }});
         }}
         function selectDate(date) {{
-            currentDate = date; document.querySelectorAll('.date-item').forEach(el => el.classList.remove('active'));
+            searchRun++; currentDate = date; document.querySelectorAll('.date-item').forEach(el => el.classList.remove('active'));
             const activeItem = document.getElementById('date-' + date); if (activeItem) activeItem.classList.add('active');
-            const container = document.getElementById('content-area'); container.innerHTML = ''; currentMediaList = [];
-            selectedIndices.clear(); // Clear selection on navigate
-            data[date].forEach(group => {{
-                const validMedia = group.media.filter(m => currentFilter === 'all' || m.is_favorite); if (validMedia.length === 0) return;
-                renderGroup({{ ...group, media: validMedia }}, container, null);
+            const container = document.getElementById('content-area'); clearView(container); // Clear selection on navigate
+            loadDay(date).then(() => {{
+                if (currentDate !== date || isSearchMode) return; // 読み込み中に別の日付が選択された
+                clearView(container);
+                (data[date] || []).forEach(group => {{
+                    const validMedia = group.media.filter(m => currentFilter === 'all' || m.is_favorite); if (validMedia.length === 0) return;
+                    renderGroup({{ ...group, media: validMedia }}, container, null);
+                }});
+                document.getElementById('main').scrollTop = 0;
             }});
-            document.getElementById('main').scrollTop = 0;
+        }}
+        // 仮想化: グループの枠とプロンプトはすぐに作り、画像グリッドは CHUNK_SIZE 件ごとの枠 (推定の高さのみ) を作って
+        // 表示範囲の近くに来た枠だけ中身を作る。離れた枠は実際の高さを保ったまま中身を破棄する (動画の読み込みも解放)
+        const CHUNK_SIZE = 40, RENDER_MARGIN = '1500px 0px';
+        const itemElements = new Map(); // 作成済みの media-item (currentMediaList の番号 → 要素)
+        let chunkObserver = null;
+        function observeChunk(grid) {{
+            if (!chunkObserver) {{
+                const root = document.getElementById('main');
+                chunkObserver = new IntersectionObserver(entries => entries.forEach(en => en.isIntersecting ? mountChunk(en.target) : unmountChunk(en.target)), {{ root, rootMargin: RENDER_MARGIN }});
+            }}
+            chunkObserver.observe(grid);
+        }}
+        function releaseVideo(v) {{ v.pause(); v.removeAttribute('src'); v.load(); }}
+        // 動画は一覧では読み込まず (解像度に合わせた枠と長さのみ表示)、マウスを乗せた時だけ <video> を作成して再生する
+        function formatDuration(sec) {{ const s = Math.round(sec); return `${{Math.floor(s / 60)}}:${{String(s % 60).padStart(2, '0')}}`; }}
+        function attachHoverVideo(item, m) {{
+            const poster = item.firstChild; if (poster.querySelector('video')) return;
+            const v = document.createElement('video'); v.muted = true; v.playsInline = true; v.loop = true; v.src = m.path;
+            poster.appendChild(v); v.play().catch(() => {{}});
+        }}
+        function detachHoverVideo(item) {{ const v = item.firstChild.querySelector('video'); if (v) {{ releaseVideo(v); v.remove(); }} }}
+        function clearView(container) {{
+            if (chunkObserver) chunkObserver.disconnect();
+            container.querySelectorAll('video').forEach(releaseVideo);
+            container.innerHTML = ''; currentMediaList = []; itemElements.clear(); selectedIndices.clear();
+        }}
+        function estimateChunkHeight(count) {{
+            // グループの内側の幅から列数を求め、正方形として概算する (表示後は実際の高さを使う)
+            const width = Math.max(document.getElementById('content-area').clientWidth - 40, 200);
+            const cols = Math.max(1, Math.floor((width + 10) / 210)), colWidth = (width - 10 * (cols - 1)) / cols, rows = Math.ceil(count / cols);
+            return rows * colWidth + (rows - 1) * 10;
+        }}
+        function mountChunk(grid) {{
+            if (grid.dataset.mounted) return; grid.dataset.mounted = '1';
+            const frag = document.createDocumentFragment();
+            grid.chunk.media.forEach((m, i) => frag.appendChild(createMediaItem(m, grid.chunk.base + i)));
+            grid.appendChild(frag); grid.style.height = '';
+        }}
+        function unmountChunk(grid) {{
+            if (!grid.dataset.mounted) return;
+            if (grid.offsetHeight) grid.style.height = grid.offsetHeight + 'px'; // 折りたたみ中 (高さ 0) は前の高さのまま
+            grid.querySelectorAll('video').forEach(releaseVideo);
+            grid.querySelectorAll('.media-item').forEach(el => itemElements.delete(+el.dataset.idx));
+            grid.textContent = ''; delete grid.dataset.mounted;
+        }}
+        function createMediaItem(m, globalIdx) {{
+            const item = document.createElement('div'); item.className = 'media-item' + (selectedIndices.has(globalIdx) ? ' selected' : '');
+            // Set ID for selection logic
+            item.dataset.idx = globalIdx; itemElements.set(globalIdx, item);
+            item.onclick = (e) => handleItemClick(e, globalIdx, m.type);
+            item.draggable = true; 
+            item.ondragstart = (e) => handleDragStart(e, globalIdx, m);
+            
+            const copyBtn = `<div class="copy-btn" onclick="event.stopPropagation(); copyToClipboard('${{m.path}}', this)">&#10064;</div>`;
+            const videoLabel = m.type === 'video' ? `<div class="video-label">VIDEO${{m.duration != null ? ' ' + formatDuration(m.duration) : ''}}</div>` : '';
+            const ratio = m.width && m.height ? `${{m.width}} / ${{m.height}}` : '16 / 9';
+            const content = m.type === 'video' ? `<div class="video-poster" style="aspect-ratio: ${{ratio}}">&#9654;</div>` : `<img src="${{m.thumb || m.path}}" loading="lazy">`;
+            
+            item.innerHTML = content + videoLabel + copyBtn;
+            if (m.type === 'video') {{ item.onmouseenter = () => attachHoverVideo(item, m); item.onmouseleave = () => detachHoverVideo(item); }}
+            return item;
         }}
         function renderGroup(group, parent, dateLabel) {{
             const baseIndex = currentMediaList.length; group.media.forEach(m => currentMediaList.push(m));
@@ -719,31 +1219,89 @@ def generate_viewer_html(fav_set):
                 header.innerHTML = '<div class="prompt-ctrl"><span class="toggle-icon">▼</span><div class="no-prompt" style="display:inline;">画像のみ</div></div>';
             }}
             div.appendChild(header);
-            const grid = document.createElement('div'); grid.className = 'media-grid';
-            group.media.forEach((m, i) => {{
-                const item = document.createElement('div'); item.className = 'media-item'; 
-                // Set ID for selection logic
-                const globalIdx = baseIndex + i; item.dataset.idx = globalIdx;
-                item.onclick = (e) => handleItemClick(e, globalIdx, m.type);
-                item.draggable = true; 
-                item.ondragstart = (e) => handleDragStart(e, globalIdx, m);
-                
-                const copyBtn = `<div class="copy-btn" onclick="event.stopPropagation(); copyToClipboard('${{m.path}}', this)">&#10064;</div>`;
-                const videoLabel = m.type === 'video' ? `<div class="video-label">VIDEO</div>` : '';
-                const content = m.type === 'video' ? `<video src="${{m.path}}#t=0.1" muted playsinline onmouseover="this.play()" onmouseout="this.pause(); this.currentTime=0.1;"></video>` : `<img src="${{m.path}}" loading="lazy">`;
-                
-                item.innerHTML = content + videoLabel + copyBtn;
-                grid.appendChild(item);
-            }});
-            div.appendChild(grid); parent.appendChild(div);
+            for (let start = 0; start < group.media.length; start += CHUNK_SIZE) {{
+                const grid = document.createElement('div'); grid.className = 'media-grid';
+                grid.chunk = {{ media: group.media.slice(start, start + CHUNK_SIZE), base: baseIndex + start }};
+                grid.style.height = estimateChunkHeight(grid.chunk.media.length) + 'px';
+                div.appendChild(grid); observeChunk(grid);
+            }}
+            parent.appendChild(div);
         }}
-        function performSearch() {{
+        // 検索: 生成時に作成した転置インデックス (search.js) で候補を絞り、該当日のデータのみ読み込んで照合する
+        const CJK_RANGES = {json.dumps(CJK_RANGES)}, SEARCH_BATCH = 20;
+        let searchIndex = null, searchTerms = [], searchLoading = null, searchRun = 0; const postingCache = {{}};
+        function grokViewerSearch(index) {{ searchIndex = index; searchTerms = Object.keys(index.terms); }}
+        function loadSearchIndex() {{
+            if (!searchLoading) searchLoading = loadScript(`${{VIEWER_DATA}}/search.js?v=${{searchVersion}}`).catch(() => {{ searchLoading = null; }});
+            return searchLoading;
+        }}
+        function isCjk(ch) {{ const c = ch.codePointAt(0); return CJK_RANGES.some(([lo, hi]) => lo <= c && c <= hi); }}
+        function tokenize(text) {{
+            // search_index.py の tokenize() と同じ規則 (英数字は単語・CJK は2文字単位)
+            const tokens = new Set(); let word = '', cjk = [];
+            const flushWord = () => {{ if (word) tokens.add(word); word = ''; }};
+            const flushCjk = () => {{ if (cjk.length === 1) tokens.add(cjk[0]); for (let i = 0; i < cjk.length - 1; i++) tokens.add(cjk[i] + cjk[i + 1]); cjk = []; }};
+            for (const ch of text.toLowerCase()) {{
+                if (isCjk(ch)) {{ flushWord(); cjk.push(ch); }}
+                else if (/[\p{{L}}\p{{N}}]/u.test(ch)) {{ flushCjk(); word += ch; }}
+                else {{ flushWord(); flushCjk(); }}
+            }}
+            flushWord(); flushCjk(); return [...tokens];
+        }}
+        function postings(key) {{
+            let ids = postingCache[key];
+            if (!ids) {{ ids = []; let id = 0; for (const d of searchIndex.terms[key]) {{ id += d; ids.push(id); }} postingCache[key] = ids; }}
+            return ids;
+        }}
+        function lookupToken(token) {{
+            // 単語の途中一致 (例: "cat" → "category") も拾うため、token を含む語をすべて対象にする
+            const ids = new Set();
+            if (searchIndex.terms[token]) postings(token).forEach(id => ids.add(id));
+            for (const key of searchTerms) if (key !== token && key.includes(token)) postings(key).forEach(id => ids.add(id));
+            return ids;
+        }}
+        async function performSearch() {{
             const q = document.getElementById('search-input').value.trim().toLowerCase(); if (!q) return;
-            const container = document.getElementById('content-area'); container.innerHTML = ''; currentMediaList = [];
-            let hit = 0; const frag = document.createDocumentFragment();
-            dates.forEach(d => data[d].forEach(g => {{ if (g.prompt && g.prompt.content.toLowerCase().includes(q)) {{ hit++; renderGroup(g, frag, d); }} }}));
-            if (hit === 0) container.innerHTML = '<div style="text-align:center; padding:50px; color:#888;">No matches.</div>'; else container.appendChild(frag);
-            document.getElementById('search-status').innerText = `${{hit}} 件ヒット`; document.getElementById('main').scrollTop = 0;
+            const run = ++searchRun; const status = document.getElementById('search-status'); status.innerText = '読み込み中...';
+            const terms = q.split(/\s+/);
+            // 日付の入力値と日付のキーはどちらも 'YYYY-MM-DD' (文字列の大小で比較できる)
+            const from = document.getElementById('search-from').value, to = document.getElementById('search-to').value;
+            const inRange = d => (!from || d >= from) && (!to || d <= to);
+            await loadSearchIndex(); if (run !== searchRun) return;
+
+            let targets; // [日付, グループ番号]
+            if (searchIndex) {{
+                // 全語句のトークンの積集合 (AND)。トークンを含まない語句 (記号のみ等) は後段の照合でのみ判定
+                let candidates = null;
+                for (const token of terms.flatMap(tokenize)) {{
+                    const ids = lookupToken(token);
+                    candidates = candidates ? candidates.filter(id => ids.has(id)) : [...ids].sort((a, b) => a - b);
+                    if (candidates.length === 0) break;
+                }}
+                if (candidates === null) candidates = searchIndex.docs.map((_, id) => id);
+                targets = candidates.map(id => [searchIndex.dates[searchIndex.docs[id][0]], searchIndex.docs[id][1]]).filter(([d]) => inRange(d));
+            }} else {{
+                // インデックスが読めない場合は全件照合
+                const days = dates.filter(inRange); await Promise.all(days.map(loadDay)); if (run !== searchRun) return;
+                targets = days.flatMap(d => (data[d] || []).map((_, i) => [d, i]));
+            }}
+            await Promise.all([...new Set(targets.map(([d]) => d))].filter(d => dayIndex[d]).map(loadDay)); if (run !== searchRun) return;
+            const hits = targets.filter(([d, i]) => {{ const g = (data[d] || [])[i]; if (!g || !g.prompt) return false; const text = g.prompt.content.toLowerCase(); return terms.every(t => text.includes(t)); }});
+
+            const container = document.getElementById('content-area'); clearView(container);
+            document.getElementById('main').scrollTop = 0;
+            if (hits.length === 0) {{ container.innerHTML = '<div style="text-align:center; padding:50px; color:#888;">No matches.</div>'; status.innerText = '0 件ヒット'; return; }}
+            // 結果は少しずつ描画し、最初の結果をすぐに表示する
+            let shown = 0;
+            const step = () => {{
+                if (run !== searchRun) return;
+                const frag = document.createDocumentFragment(); const end = Math.min(shown + SEARCH_BATCH, hits.length);
+                for (; shown < end; shown++) {{ const [d, i] = hits[shown]; renderGroup(data[d][i], frag, d); }}
+                container.appendChild(frag);
+                status.innerText = shown < hits.length ? `${{hits.length}} 件ヒット (表示中 ${{shown}})` : `${{hits.length}} 件ヒット`;
+                if (shown < hits.length) requestAnimationFrame(step);
+            }};
+            step();
         }}
         function openModalByIndex(idx) {{
             currentMediaIndex = idx; const m = currentMediaList[idx]; const modal = document.getElementById('modal'); const content = document.getElementById('modal-content');
@@ -769,29 +1327,26 @@ def generate_viewer_html(fav_set):
         function handleItemClick(e, idx, type) {{
             if (e.ctrlKey) {{
                 // Toggle selection
-                if (selectedIndices.has(idx)) selectedIndices.delete(idx);
-                else selectedIndices.add(idx);
-                updateSelectionVisuals();
+                setSelected(idx, !selectedIndices.has(idx));
                 return;
             }}
             if (type === 'video') {{ openModalByIndex(idx); return; }}
             
             // Normal click
-            if (selectedIndices.size > 0) {{
-                selectedIndices.clear();
-                updateSelectionVisuals();
-            }}
+            if (selectedIndices.size > 0) clearSelection();
             openModalByIndex(idx);
         }}
         function toggleGroup(groupDiv) {{
             groupDiv.classList.toggle('collapsed');
         }}
-        function updateSelectionVisuals() {{
-            document.querySelectorAll('.media-item').forEach(el => {{
-                const idx = parseInt(el.dataset.idx);
-                if (selectedIndices.has(idx)) el.classList.add('selected');
-                else el.classList.remove('selected');
-            }});
+        // 選択状態の変更は対象の要素のみ更新する (未作成の要素は作成時に反映)
+        function setSelected(idx, on) {{
+            if (on) selectedIndices.add(idx); else selectedIndices.delete(idx);
+            const el = itemElements.get(idx); if (el) el.classList.toggle('selected', on);
+        }}
+        function clearSelection() {{
+            selectedIndices.forEach(idx => {{ const el = itemElements.get(idx); if (el) el.classList.remove('selected'); }});
+            selectedIndices.clear();
         }}
         function getFullPath(relPath) {{
             let bp = window.location.pathname;
@@ -818,7 +1373,7 @@ def generate_viewer_html(fav_set):
                 }}
             }} else {{
                 // Single drag
-                selectedIndices.clear(); updateSelectionVisuals(); // Clear others if dragging unselected
+                clearSelection(); // Clear others if dragging unselected
                 const url = new URL(m.path, window.location.href).href;
                 const mime = m.type === 'video' ? 'video/mp4' : 'image/jpeg';
                 e.dataTransfer.setData('DownloadURL', `${{mime}}:${{m.name}}:${{url}}`);
@@ -853,27 +1408,261 @@ def generate_viewer_html(fav_set):
 </body></html>"""
 
     try:
-        with open(VIEWER_PATH, "w", encoding="utf-8") as f:
-            f.write(html_content)
+        # ビューアー本体はデータを含まないため、内容が変わった場合のみ置き換える
+        with AtomicWriter(VIEWER_PATH) as out:
+            out.write(html_content)
         print(f"   [OK] 生成完了: {VIEWER_PATH}")
-        webbrowser.open(f"file://{VIEWER_PATH}")
+        if open_browser: open_viewer()
     except Exception as e:
         print(f"   [Error] 生成失敗: {e}")
 
-def main():
+def open_viewer():
+    import webbrowser
+    webbrowser.open(f"file://{VIEWER_PATH}")
+
+def _build_signature():
+    """実行ファイル (スクリプト版は同フォルダの .py) の更新日時。更新された場合はビューアーを作り直す"""
+    if getattr(sys, 'frozen', False):
+        st = os.stat(sys.executable)
+        return [st.st_size, st.st_mtime_ns]
+    with os.scandir(BASE_DIR) as it:
+        return [max((entry.stat().st_mtime_ns for entry in it if entry.name.endswith(".py")), default=0)]
+
+def _state_dirs():
+    """変更の有無を判定するフォルダ (_Data 以下の全フォルダ。System は FavLogs のみ)
+
+    ファイルの追加・削除・名前変更はフォルダの mtime が変わるため、ファイルを1件ずつ調べなくても検出できる。
+    """
+    dirs, stack = [], [DATA_DIR]
+    while stack:
+        current = stack.pop()
+        dirs.append(current)
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir() and not (current == DATA_DIR and entry.name == "System"):
+                        stack.append(Path(entry.path))
+        except OSError: pass
+    return dirs + [DATA_DIR / "System" / "FavLogs"]
+
+def snapshot_dirs():
+    """各フォルダの現在の mtime (処理の開始前に取得する)
+
+    処理中に拡張機能が保存したファイルは、処理済みの一覧に含まれていない可能性があるため、
+    完了時ではなく開始前の mtime を記録し、次回の実行で変更として検出させる
+    (整理処理自身による変更も次回は変更として扱われ、整理処理が1回余分に実行される)。
+    """
+    dirs = {}
+    for d in _state_dirs():
+        try:
+            dirs[os.path.relpath(d, DATA_DIR)] = os.stat(d).st_mtime_ns
+        except OSError: pass
+    return dirs
+
+def save_run_state(dirs):
+    """全処理の完了時に、開始前に取得した各フォルダの mtime (snapshot_dirs) を記録する"""
+    try:
+        write_json_atomic(DATA_DIR / "System" / RUN_STATE_FILE, {"build": _build_signature(), "dirs": dirs})
+    except Exception: pass
+
+def nothing_changed():
+    """前回の実行から処理対象に変更がなく、ビューアーも揃っている場合は True
+
+    重いモジュールを読み込む前に判定するため、フォルダの stat と Downloads の列挙のみで判定する。
+    (同名ファイルの上書きのみの変更は検出しないため、次に変更があった際の実行で反映される)
+    """
+    try:
+        with open(DATA_DIR / "System" / RUN_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if state.get("build") != _build_signature(): return False
+        if not VIEWER_PATH.exists() or not (VIEWER_DATA_DIR / "index.js").exists(): return False
+        for rel, mtime_ns in state["dirs"].items():
+            if os.stat(DATA_DIR / rel).st_mtime_ns != mtime_ns: return False
+        if DOWNLOAD_DIR.exists():
+            with os.scandir(DOWNLOAD_DIR) as it:
+                for entry in it:
+                    name = entry.name.lower()
+                    if name.startswith("grok-video-") and name.endswith(".mp4"): return False
+    except Exception:
+        return False
+    return True
+
+def watch_targets():
+    """常駐モードで監視するフォルダ"""
+    from watcher import WatchTarget
+    return [
+        WatchTarget("videos", DOWNLOAD_DIR, lambda name: name.startswith("grok-video-") and name.lower().endswith(".mp4")),
+        WatchTarget("prompts", DATA_DIR / "Prompts", lambda name: name.lower().endswith(".txt") and name != MERGED_PROMPT_FILE),
+        WatchTarget("favorites", DATA_DIR / "System" / "FavLogs", lambda name: name.lower().endswith(".json")),
+        WatchTarget("images", DATA_DIR / "Images", lambda name: name.lower().endswith(IMAGE_EXTS),
+                    subdir_filter=lambda name: re.match(r'^\d{8}$', name) is not None, track_removals=True),
+    ]
+
+def watch(fav_set):
+    """常駐モード: フォルダの変更を監視し、変更のあった処理のみ実行する"""
+    from watcher import ChangeWatcher
+    watcher = ChangeWatcher(watch_targets())
+    print(f"\n [Watch] フォルダの監視を開始しました ({watcher.backend})。終了するには Ctrl+C を押してください。")
+    try:
+        while True:
+            changes = watcher.wait()
+            print("\n" + "-" * 60)
+            print(f" [Watch] {datetime.now().strftime('%H:%M:%S')} 変更を検出: {', '.join(sorted(changes))}")
+            # フォルダの内容が変わっているため、一覧は毎回作り直す
+            inventory = Inventory()
+            updated = False
+            try:
+                if "videos" in changes:
+                    updated |= move_videos(inventory, settle_sec=VIDEO_SETTLE_SEC) > 0
+                    # 書き込み中でスキップした動画は、しばらくしてから再試行する
+                    if inventory.files(DOWNLOAD_DIR, pattern="grok-video-*.mp4"):
+                        watcher.mark("videos")
+                if "prompts" in changes:
+                    updated |= organize_prompts(inventory) > 0
+                if "favorites" in changes:
+                    new_fav_set = organize_favorites(inventory)
+                    updated |= new_fav_set != fav_set
+                    fav_set = new_fav_set
+                if "images" in changes:
+                    clean_garbage_images(fav_set, inventory)
+                    updated = True
+                if updated:
+                    index_videos(inventory)
+                    generate_viewer_html(fav_set, inventory, open_browser=False)
+            except Exception as e:
+                print(f"\n [Error] エラーが発生しました: {e}")
+    except KeyboardInterrupt:
+        print(f"\n [Watch] 監視を終了しました。")
+    finally:
+        watcher.close()
+
+def write_run_report(recorder, profiler=None):
+    """計測結果の表示と、レポート (JSON / pstats) の保存"""
+    recorder.print_summary()
+    try:
+        path = recorder.write_report(REPORT_DIR)
+        print(f"   [Info] 計測レポート: {path}")
+        if profiler:
+            import pstats
+            profile_path = REPORT_DIR / f"profile_{recorder.started.strftime('%Y%m%d_%H%M%S')}.pstats"
+            profiler.dump_stats(str(profile_path))
+            prune_reports(REPORT_DIR, "profile_")
+            print(f"\n [Profile] 累積時間の上位 20 件 (全体: {profile_path})")
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    except Exception as e:
+        print(f"   [Error] 計測レポートの保存失敗: {e}")
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Grok Organizer - 画像整理 & ビューアー生成")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="画像検査・ハッシュ計算の並列プロセス数 (0: 自動, 1: 逐次処理)")
+    parser.add_argument("--watch", action="store_true",
+                        help="通常の整理を実行した後、フォルダを監視して変更があるたびに差分処理する (常駐モード)")
+    parser.add_argument("--profile", action="store_true",
+                        help="cProfile で計測し、結果 (pstats) を _Data/System/reports に保存する")
+    parser.add_argument("--metrics", action="store_true",
+                        help="計測レポートに処理ごとの open したファイル数も記録する (監査フックを使うため、わずかに遅くなる)")
+    parser.add_argument("--sequential", action="store_true",
+                        help="依存関係のない処理も同時に実行せず、1つずつ順に実行する")
+    parser.add_argument("--similar", action="store_true",
+                        help="知覚ハッシュで類似画像 (再エンコード・縮小・形式違い) も検出し、古いものを残して削除する")
+    parser.add_argument("--similar-threshold", type=int, default=None,
+                        help=f"類似とみなす知覚ハッシュの距離 (0-64, 既定: {SIMILAR_THRESHOLD})")
+    parser.add_argument("--similar-dry-run", action="store_true",
+                        help="類似画像を削除せず、対象の組を表示して _Data/System/reports に出力する (--similar を含む)")
+    parser.add_argument("--prompt-window", type=int, default=None,
+                        help=f"ビューアーでプロンプトと画像・動画を対応付ける最大の時間差 (秒, 既定: {PROMPT_WINDOW_SEC})")
+    return parser.parse_args(argv)
+
+def build_pipeline(inventory, recorder=None, sequential=False):
+    """整理処理の依存関係 (依存のない処理はスレッドで同時に実行する)
+
+    - 動画移動・プロンプト統合・Favorites統合は扱うフォルダが異なるため同時に実行
+    - 画像クリーニングは Favorites (継承判定) と動画移動 (日付フォルダの指紋) の完了後
+    - 動画情報の取得は日付フォルダの変更 (動画移動・画像クリーニング) の完了後
+    - ビューアー生成は全処理の完了後
+    """
+    from scheduler import StageScheduler
+    scheduler = StageScheduler(recorder, inventory, max_workers=1 if sequential else None)
+    scheduler.add("move_videos", lambda r: move_videos(inventory))
+    scheduler.add("organize_prompts", lambda r: organize_prompts(inventory))
+    scheduler.add("organize_favorites", lambda r: organize_favorites(inventory))
+    scheduler.add("clean_garbage_images", lambda r: clean_garbage_images(r["organize_favorites"], inventory),
+                  requires=("move_videos", "organize_favorites"))
+    scheduler.add("index_videos", lambda r: index_videos(inventory),
+                  requires=("move_videos", "clean_garbage_images"))
+    scheduler.add("generate_viewer_html", lambda r: generate_viewer_html(r["organize_favorites"], inventory),
+                  requires=("organize_prompts", "index_videos"))
+    return scheduler
+
+def print_banner():
+    title = "Grok Organizer"
+    # 色出力用 (任意)
+    try:
+        from colorama import init, Fore, Style
+        init()
+        title = f"{Fore.CYAN}{title}{Style.RESET_ALL}"
+    except ImportError:
+        pass
     print("=" * 60)
-    print(f"{Fore.CYAN}Grok Organizer{Style.RESET_ALL} - 画像整理 & ビューアー生成")
+    print(f"{title} - 画像整理 & ビューアー生成")
     print("=" * 60)
+
+def main(argv=None):
+    global WORKER_COUNT, SIMILAR_MODE, SIMILAR_THRESHOLD, SIMILAR_DRY_RUN, PROMPT_WINDOW_SEC
+    startup = measure_startup(time.perf_counter() - _LOAD_STARTED)
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # オプションなしで前回から変更がない場合は、整理処理 (重いモジュールの読み込み) を行わずにビューアーを開く
+    if not argv and nothing_changed():
+        print_banner()
+        print(f" [Info] 前回の実行から変更はありません。ビューアーを開きます。")
+        print(f"   {format_startup(startup)}")
+        open_viewer()
+        return
+    args = parse_args(argv)
+    if args.workers is not None:
+        WORKER_COUNT = max(args.workers, 0)
+    if args.similar or args.similar_dry_run:
+        SIMILAR_MODE = True
+        SIMILAR_DRY_RUN = SIMILAR_DRY_RUN or args.similar_dry_run
+    if args.similar_threshold is not None:
+        SIMILAR_THRESHOLD = min(max(args.similar_threshold, 0), 64)
+    if args.prompt_window is not None:
+        PROMPT_WINDOW_SEC = max(args.prompt_window, 0)
+
+    print_banner()
+    recorder = RunRecorder(argv, count_opens=args.metrics)
+    recorder.startup = startup
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    fav_set = None
     try:
-        move_videos()
-        organize_prompts()
-        fav_set = organize_favorites()
-        clean_garbage_images(fav_set) 
-        generate_viewer_html(fav_set) 
+        # 途中で失敗した場合に次回の高速終了の対象にならないよう、前回の状態を消しておく
+        try: (DATA_DIR / "System" / RUN_STATE_FILE).unlink()
+        except OSError: pass
+        # 全処理で共有するファイル一覧 (各フォルダの列挙は1回のみ)
+        inventory = Inventory()
+        dirs = snapshot_dirs()
+        results = build_pipeline(inventory, recorder, sequential=args.sequential).run()
+        fav_set = results["organize_favorites"]
+        save_run_state(dirs)
         print("-" * 60)
         print(f" [Done] 全ての整理が完了しました。")
     except Exception as e:
         print(f"\n [Error] エラーが発生しました: {e}")
+    finally:
+        if profiler: profiler.disable()
+        write_run_report(recorder, profiler)
+    if args.watch and fav_set is not None:
+        watch(fav_set)
 
 if __name__ == "__main__":
+    # EXE (PyInstaller) でのプロセスプール利用に必要 (スクリプト実行時は不要なため読み込まない)
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,157 @@
+"""
+画像ヘッダー解析 (Probe)
+
+PNG (IHDR) / JPEG (SOFn) / WebP (VP8 / VP8L / VP8X) のヘッダーのみを読み、
+幅・高さ・カラーモードを取得する。解析できない形式のみ Pillow にフォールバックする。
+"""
+import struct
+import time
+
+HEAD_SIZE = 32  # PNG: 26 bytes / WebP: 30 bytes で判定可能
+
+# Pillow と同じモード表記に合わせる
+PNG_MODES = {(0, 1): "1", (0, 2): "L", (0, 4): "L", (0, 8): "L", (0, 16): "I;16",
+             (2, 8): "RGB", (2, 16): "RGB", (3, 1): "P", (3, 2): "P", (3, 4): "P", (3, 8): "P",
+             (4, 8): "LA", (4, 16): "LA", (6, 8): "RGBA", (6, 16): "RGBA"}
+JPEG_MODES = {1: "L", 3: "RGB", 4: "CMYK"}
+# SOF0-3, 5-7, 9-11, 13-15 (DHT: C4, JPG: C8, DAC: CC は除外)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class ProbeStats:
+    """Probe の処理件数と読み込みバイト数の集計"""
+
+    def __init__(self):
+        self.header = 0
+        self.fallback = 0
+        self.failed = 0
+        self.bytes_read = 0
+        self.started = time.perf_counter()
+
+    @property
+    def total(self):
+        return self.header + self.fallback + self.failed
+
+    def counters(self):
+        return self.header, self.fallback, self.failed, self.bytes_read
+
+    def merge(self, counters):
+        header, fallback, failed, bytes_read = counters
+        self.header += header
+        self.fallback += fallback
+        self.failed += failed
+        self.bytes_read += bytes_read
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-6)
+        return (f"{self.total} 件 ({self.total / elapsed:.0f} 件/秒, ヘッダー解析: {self.header}, "
+                f"Pillow: {self.fallback}, 失敗: {self.failed}, 読込: {self.bytes_read / 1024:.0f}KB)")
+
+
+def _probe_png(head):
+    if head[12:16] != b"IHDR": return None
+    width, height, depth, color = struct.unpack(">IIBB", head[16:26])
+    return width, height, PNG_MODES.get((color, depth), "RGB")
+
+
+def _probe_webp(head):
+    chunk = head[12:16]
+    if chunk == b"VP8 " and head[23:26] == b"\x9d\x01\x2a":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF, "RGB"
+    if chunk == b"VP8L" and head[20] == 0x2F:
+        bits = int.from_bytes(head[21:25], "little")
+        has_alpha = bits >> 28 & 1
+        return (bits & 0x3FFF) + 1, (bits >> 14 & 0x3FFF) + 1, "RGBA" if has_alpha else "RGB"
+    if chunk == b"VP8X":
+        has_alpha = head[20] & 0x10
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height, "RGBA" if has_alpha else "RGB"
+    return None
+
+
+def _probe_jpeg(f, stats):
+    """マーカーを辿り SOFn を探す (セグメント本体は seek で読み飛ばす)"""
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        stats.bytes_read += 1
+        if not b: return None
+        if b[0] != 0xFF: continue
+        marker = 0xFF
+        while marker == 0xFF:  # フィルバイト
+            b = f.read(1)
+            stats.bytes_read += 1
+            if not b: return None
+            marker = b[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8: continue  # 長さを持たないマーカー
+        if marker == 0xD9 or marker == 0xDA: return None  # EOI / SOS 到達
+        seg = f.read(2)
+        stats.bytes_read += 2
+        if len(seg) < 2: return None
+        length = struct.unpack(">H", seg)[0]
+        if marker in JPEG_SOF_MARKERS:
+            sof = f.read(6)
+            stats.bytes_read += 6
+            if len(sof) < 6: return None
+            _, height, width, components = struct.unpack(">BHHB", sof)
+            return width, height, JPEG_MODES.get(components, "RGB")
+        f.seek(length - 2, 1)
+
+
+def _probe_with_pillow(path):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    with Image.open(path) as img:
+        return img.size[0], img.size[1], img.mode
+
+
+def probe_image(path, stats=None):
+    """(width, height, mode) を返す。判定できない場合は None"""
+    if stats is None: stats = ProbeStats()
+    result = None
+    try:
+        with open(path, "rb") as f:
+            head = f.read(HEAD_SIZE)
+            stats.bytes_read += len(head)
+            if head.startswith(b"\x89PNG\r\n\x1a\n"):
+                result = _probe_png(head)
+            elif head.startswith(b"\xff\xd8"):
+                result = _probe_jpeg(f, stats)
+            elif head[:4] == b"RIFF" and head[8:12] == b"WEBP" and len(head) >= 30:
+                result = _probe_webp(head)
+    except (OSError, struct.error):
+        result = None
+
+    if result is not None:
+        stats.header += 1
+        return result
+    try:
+        result = _probe_with_pillow(path)
+    except Exception:
+        result = None
+    if result is None:
+        stats.failed += 1
+    else:
+        stats.fallback += 1
+    return result
+
+
+def probe_worker(path):
+    """プロセスプール用: (probe結果, 集計値) を返す"""
+    stats = ProbeStats()
+    return probe_image(path, stats), stats.counters()
+
+
+def probe_many(paths, stats, executor=None, chunksize=16):
+    """paths の順序どおりに probe 結果を返す (executor 指定時は並列実行)"""
+    if executor is None:
+        for path in paths:
+            yield probe_image(path, stats)
+        return
+    for result, counters in executor.map(probe_worker, paths, chunksize=chunksize):
+        stats.merge(counters)
+        yield result
@@ -0,0 +1,311 @@
+"""
+処理ごとの計測 (Instrumentation)
+
+各処理 (stage) の経過時間・CPU時間・stat / open したファイル数・読み書きバイト数・ピークメモリ・削除件数を記録し、
+実行後に一覧表示と JSON レポート (_Data/System/reports) の出力を行う。
+
+- stat / 削除 / 移動の件数は、ファイル一覧 (Inventory) の呼び出し箇所で count() により数える
+  (os.stat などの差し替えは行わないため、他のライブラリの処理には影響しない。os.scandir の列挙は別集計)。
+- open の件数は --metrics を指定した場合のみ監査フック (sys.addaudithook) で数える
+  (監査フックは一度登録すると解除できず、以降の全ての open が遅くなるため既定では登録しない)。
+- 読み書きバイト数は OS のプロセス単位の I/O カウンタ (Linux: /proc/self/io, Windows: GetProcessIoCounters)。
+- 並列処理の子プロセスは CPU 時間のみ含まれる (ファイル数・バイト数は含まれないため、詳細は --workers 1 で計測する)。
+- 処理をスレッドで並行実行した場合も、CPU 時間・ファイル数はスレッド単位で集計する
+  (読み書きバイト数・ピークメモリはプロセス単位のため、同時に実行された処理の分を含む)。
+- 起動時間 (プロセス開始から main まで) と、起動時に読み込まれた重いモジュールも記録する。
+"""
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+REPORT_KEEP = 10  # 保存するレポートの世代数
+# 起動時間の目安 (秒)。超えた場合は python -X importtime での確認を促す
+STARTUP_BUDGET_SEC = 1.0
+# 起動時 (main の開始時点) には読み込まれていないはずのモジュール (各処理の中で読み込む)
+HEAVY_MODULES = ("PIL", "sqlite3", "multiprocessing", "concurrent.futures", "webbrowser", "argparse", "colorama")
+
+_local = threading.local()
+_hook_installed = False
+
+
+def _current():
+    return getattr(_local, "stage", None)
+
+
+def count(field, n=1):
+    """現在のスレッドで計測中の処理の件数 (files_stat / deleted / moved) に加算する (計測中でなければ何もしない)"""
+    metrics = _current()
+    if metrics is not None:
+        setattr(metrics, field, getattr(metrics, field) + n)
+
+
+def _audit_hook(event, args):
+    if event == "open":
+        metrics = _current()
+        if metrics is not None and metrics.files_opened is not None:
+            metrics.files_opened += 1
+
+
+def _cpu_seconds():
+    # 現在のスレッドの CPU 時間 + 終了済みの子プロセス (プロセスプール) の CPU 時間 (Windows では取得できない)
+    t = os.times()
+    return time.thread_time() + t.children_user + t.children_system
+
+
+def _io_counters():
+    """(読込バイト数, 書込バイト数)。取得できない環境では None"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class IO_COUNTERS(ctypes.Structure):
+                _fields_ = [(name, ctypes.c_ulonglong) for name in (
+                    "ReadOperationCount", "WriteOperationCount", "OtherOperationCount",
+                    "ReadTransferCount", "WriteTransferCount", "OtherTransferCount")]
+
+            counters = IO_COUNTERS()
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            if kernel32.GetProcessIoCounters(kernel32.GetCurrentProcess(), ctypes.byref(counters)):
+                return counters.ReadTransferCount, counters.WriteTransferCount
+        except Exception:
+            pass
+        return None
+    try:
+        values = {}
+        with open("/proc/self/io", "r") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                values[key] = int(value)
+        return values["rchar"], values["wchar"]
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _peak_rss():
+    """プロセスのピークメモリ (バイト)。取得できない環境では None"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in (
+                        "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                        "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            if ctypes.windll.psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+        except Exception:
+            pass
+        return None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # Linux は KB 単位
+    except Exception:
+        return None
+
+
+def process_uptime(pid=None):
+    """プロセス (省略時は自身) の開始からの経過秒数。取得できない環境では None"""
+    if sys.platform == "win32":
+        try:
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+            kernel32.OpenProcess.restype = wintypes.HANDLE
+            if pid is None:
+                handle = kernel32.GetCurrentProcess()
+            else:
+                handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+                if not handle: return None
+            try:
+                times = [wintypes.FILETIME() for _ in range(4)]
+                if not kernel32.GetProcessTimes(handle, *(ctypes.byref(t) for t in times)): return None
+                now = wintypes.FILETIME()
+                kernel32.GetSystemTimeAsFileTime(ctypes.byref(now))
+            finally:
+                if pid is not None: kernel32.CloseHandle(handle)
+
+            def ticks(ft):
+                return (ft.dwHighDateTime << 32) | ft.dwLowDateTime
+            return (ticks(now) - ticks(times[0])) / 10_000_000  # 100ns 単位
+        except Exception:
+            return None
+    try:
+        with open(f"/proc/{pid or 'self'}/stat", "r") as f:
+            # comm に空白や括弧が含まれる場合に備え、最後の ")" 以降を分割する
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", "r") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")  # 22番目: starttime
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def measure_startup(import_seconds=None):
+    """起動時間の計測値 (main の開始時に呼ぶ)
+
+    PyInstaller の onefile 版は親プロセス (ブートローダー) が展開してから起動するため、
+    親プロセスとの差を展開時間として記録する。
+    """
+    startup = {
+        "process": process_uptime(),
+        "imports": import_seconds,
+        "unpack": None,
+        "modules": len(sys.modules),
+        "heavy_modules": [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+    meipass = getattr(sys, "_MEIPASS", None)
+    if meipass and os.path.normcase(os.path.abspath(meipass)) != os.path.normcase(os.path.dirname(sys.executable)):
+        parent = process_uptime(os.getppid())
+        if parent is not None and startup["process"] is not None:
+            startup["unpack"] = max(parent - startup["process"], 0.0)
+    return startup
+
+
+def format_startup(startup):
+    """起動時間の1行表示"""
+    def sec(value):
+        return "-" if value is None else f"{value:.2f}s"
+    text = f"startup {sec(startup.get('process'))} (imports {sec(startup.get('imports'))}"
+    if startup.get("unpack") is not None: text += f", unpack {sec(startup['unpack'])}"
+    text += f", modules {startup.get('modules')})"
+    if startup.get("heavy_modules"): text += f" heavy: {', '.join(startup['heavy_modules'])}"
+    return text
+
+
+class StageMetrics:
+    """1つの処理の計測値"""
+    __slots__ = ("name", "start", "wall", "cpu", "files_stat", "files_listed", "files_opened",
+                 "bytes_read", "bytes_written", "peak_rss", "deleted", "moved")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = self.wall = self.cpu = 0.0  # start: 計測開始からの開始時刻
+        self.files_stat = self.files_listed = 0
+        self.files_opened = None  # open の件数は count_opens を指定した場合のみ
+        self.bytes_read = self.bytes_written = self.peak_rss = None
+        self.deleted = self.moved = 0
+
+    def as_dict(self):
+        return {key: round(value, 4) if isinstance(value, float) else value
+                for key, value in ((key, getattr(self, key)) for key in self.__slots__)}
+
+
+class RunRecorder:
+    """処理ごとの計測値を集め、一覧表示・JSON 出力する"""
+
+    def __init__(self, argv=None, count_opens=False):
+        self.started = datetime.now()
+        self._t0 = time.perf_counter()
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.stages = []
+        self.errors = []
+        self.startup = None  # measure_startup() の結果
+        self.count_opens = count_opens
+        global _hook_installed
+        if count_opens and not _hook_installed:
+            sys.addaudithook(_audit_hook)  # 一度登録すると解除できないため、計測中以外は何もしない
+            _hook_installed = True
+
+    @contextmanager
+    def stage(self, name, inventory=None):
+        """with recorder.stage("name", inventory): ... の範囲を計測する"""
+        metrics = StageMetrics(name)
+        if self.count_opens: metrics.files_opened = 0
+        listed = inventory.listed_by_current_thread() if inventory is not None else 0
+        io_before = _io_counters()
+        cpu, wall = _cpu_seconds(), time.perf_counter()
+        metrics.start = wall - self._t0
+        previous = _current()
+        _local.stage = metrics
+        try:
+            yield metrics
+        except Exception as e:
+            self.errors.append(f"{name}: {e}")
+            raise
+        finally:
+            _local.stage = previous
+            metrics.wall = time.perf_counter() - wall
+            metrics.cpu = _cpu_seconds() - cpu
+            if inventory is not None: metrics.files_listed = inventory.listed_by_current_thread() - listed
+            io_after = _io_counters()
+            if io_before and io_after:
+                metrics.bytes_read = io_after[0] - io_before[0]
+                metrics.bytes_written = io_after[1] - io_before[1]
+            metrics.peak_rss = _peak_rss()
+            self.stages.append(metrics)
+
+    def as_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "argv": self.argv,
+            "python": sys.version.split()[0],
+            "platform": sys.platform,
+            "startup": self.startup,
+            "total_wall": round(sum(m.wall for m in self.stages), 4),
+            "elapsed": round(self.elapsed(), 4),
+            "total_cpu": round(sum(m.cpu for m in self.stages), 4),
+            "stages": [m.as_dict() for m in self.stages],
+            "errors": self.errors,
+        }
+
+    def elapsed(self):
+        """最初の処理の開始から最後の処理の終了まで (並行実行時は total_wall より短くなる)"""
+        if not self.stages: return 0.0
+        return max(m.start + m.wall for m in self.stages) - min(m.start for m in self.stages)
+
+    def print_summary(self):
+        def mb(value):
+            return "-" if value is None else f"{value / 1024 / 1024:.1f}"
+
+        def num(value):
+            return "-" if value is None else value
+
+        print(f"\n [Report] 処理ごとの計測結果")
+        print(f"   {'stage':<24}{'start':>7}{'wall(s)':>9}{'cpu(s)':>9}{'stat':>8}{'listed':>8}{'open':>8}"
+              f"{'readMB':>9}{'writeMB':>9}{'del':>6}{'peakMB':>10}")
+        for m in sorted(self.stages, key=lambda m: m.start):
+            print(f"   {m.name:<24}{m.start:>7.2f}{m.wall:>9.2f}{m.cpu:>9.2f}{m.files_stat:>8}{m.files_listed:>8}{num(m.files_opened):>8}"
+                  f"{mb(m.bytes_read):>9}{mb(m.bytes_written):>9}{m.deleted:>6}{mb(m.peak_rss):>10}")
+        print(f"   {'total':<24}{'':>7}{sum(m.wall for m in self.stages):>9.2f}{sum(m.cpu for m in self.stages):>9.2f}"
+              f"   (elapsed {self.elapsed():.2f}s)")
+        if self.startup:
+            print(f"   {format_startup(self.startup)}")
+            total = (self.startup.get("process") or 0) + (self.startup.get("unpack") or 0)
+            if total > STARTUP_BUDGET_SEC:
+                print(f"   [Warning] 起動に {total:.2f} 秒かかりました (目安: {STARTUP_BUDGET_SEC:.1f} 秒)。"
+                      f"詳細は python -X importtime grok_organizer.py で確認できます。")
+
+    def write_report(self, report_dir):
+        """JSON レポートを保存し、古いレポートを削除する。保存先のパスを返す"""
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(str(report_dir), f"run_{self.started.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2, ensure_ascii=False)
+        prune_reports(report_dir, "run_")
+        return path
+
+
+def prune_reports(report_dir, prefix, keep=REPORT_KEEP):
+    """prefix で始まるファイルを新しい順に keep 件だけ残す"""
+    try:
+        names = sorted(n for n in os.listdir(report_dir) if n.startswith(prefix))
+    except OSError:
+        return
+    for name in names[:-keep]:
+        try: os.remove(os.path.join(str(report_dir), name))
+        except OSError: pass
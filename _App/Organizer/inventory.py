@@ -0,0 +1,185 @@
+"""
+ファイル一覧 (Inventory)
+
+各フォルダを os.scandir で1回だけ列挙し、DirEntry (stat情報込み) を全処理で共有する。
+ファイルの移動・削除時は一覧を更新し、以降の処理がディスクを再走査しなくて済むようにする。
+フォルダの mtime は列挙の直前に取得して一覧と共に保持する (列挙より後の変更は、記録した mtime との比較で検出できる)。
+ただし指紋には、自身で削除・移動したフォルダについて変更後の mtime を使う (次回の実行で不一致にならないため)。
+複数の処理をスレッドで並行実行する場合も共有できる (各処理が扱うフォルダは重ならない前提)。
+stat / 削除 / 移動の件数は、計測レポート (instrumentation) 用にここで数える。
+"""
+import fnmatch
+import hashlib
+import os
+import stat
+import threading
+from pathlib import Path
+
+from instrumentation import count
+
+
+class _StatEntry:
+    """DirEntry と同じインターフェースを持つ、追加ファイル用のエントリ"""
+    __slots__ = ("name", "path", "_stat")
+
+    def __init__(self, path, st):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._stat = st
+
+    def stat(self, follow_symlinks=True):
+        return self._stat
+
+    def is_dir(self, follow_symlinks=True):
+        return stat.S_ISDIR(self._stat.st_mode)
+
+    def is_file(self, follow_symlinks=True):
+        return stat.S_ISREG(self._stat.st_mode)
+
+
+class Inventory:
+    """フォルダ単位で遅延列挙し、結果を実行中キャッシュするファイル一覧"""
+
+    def __init__(self):
+        self._dirs = {}
+        self._mtimes = {}  # 列挙の直前に取得したフォルダの mtime (ns)。フォルダがなければ None
+        self._changed = set()  # 自身で削除・移動・追加を行ったフォルダ (指紋の mtime を取り直す)
+        self._lock = threading.Lock()
+        self._thread = threading.local()
+        self.dirs_scanned = 0
+        self.files_seen = 0
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.normpath(str(path)))
+
+    def _listing(self, directory):
+        key = self._key(directory)
+        listing = self._dirs.get(key)
+        if listing is None:
+            scanned, dir_mtime = {}, None
+            try:
+                count("files_stat")
+                dir_mtime = os.stat(str(directory)).st_mtime_ns
+                with os.scandir(str(directory)) as it:
+                    for entry in it:
+                        scanned[entry.name] = entry
+            except OSError:
+                pass
+            # 列挙中は並行する処理を止めないよう、登録時のみロックする (先に登録された一覧を優先)
+            with self._lock:
+                listing = self._dirs.setdefault(key, scanned)
+                if listing is scanned:
+                    self._mtimes[key] = dir_mtime
+                    self.dirs_scanned += 1
+                    self.files_seen += len(listing)
+                    self._thread.files_seen = self.listed_by_current_thread() + len(listing)
+        return listing
+
+    def listed_by_current_thread(self):
+        """現在のスレッドで列挙したエントリ数 (処理ごとの計測用)"""
+        return getattr(self._thread, "files_seen", 0)
+
+    def dir_mtime_ns(self, directory):
+        """一覧を列挙した時点のフォルダの mtime (ns)。フォルダがなければ None
+
+        一覧の取得後にフォルダが変更された場合 (拡張機能による保存など)、現在の mtime とは一致しない。
+        """
+        self._listing(directory)
+        return self._mtimes.get(self._key(directory))
+
+    def entries(self, directory):
+        """フォルダ直下の全エントリ (DirEntry 互換)"""
+        return list(self._listing(directory).values())
+
+    def count(self, directory):
+        """フォルダ直下のエントリ数 (拡張子問わず)"""
+        return len(self._listing(directory))
+
+    def subdirs(self, directory, pattern=None):
+        directory = Path(directory)
+        return [directory / e.name for e in self._listing(directory).values()
+                if e.is_dir() and (pattern is None or fnmatch.fnmatch(e.name, pattern))]
+
+    def files(self, directory, suffixes=None, pattern=None):
+        """フォルダ直下のファイル。suffixes は小文字の拡張子のタプル (例: (".png", ".jpg"))"""
+        directory = Path(directory)
+        result = []
+        for e in self._listing(directory).values():
+            if suffixes and not e.name.lower().endswith(suffixes): continue
+            if pattern and not fnmatch.fnmatch(e.name, pattern): continue
+            try:
+                if not e.is_file(): continue
+            except OSError:
+                continue
+            result.append(directory / e.name)
+        return result
+
+    def fingerprint(self, directory):
+        """フォルダの指紋 [dir_mtime_ns, digest]。フォルダがなければ None
+
+        digest は全エントリの (名前, サイズ, mtime) のハッシュの総和 (列挙順に依存しない)。
+        ファイルの追加・削除だけでなく、件数が同じままの差し替え・上書きも検出できる。
+        dir_mtime_ns は列挙時点の値のため、列挙後に追加されたファイルは次回の指紋の不一致で検出される。
+        自身で変更したフォルダは変更後の mtime を使う (digest は一覧から計算するため、
+        その間に他から追加・変更されたファイルは digest の不一致で検出される)。
+        """
+        dir_mtime = self.dir_mtime_ns(directory)
+        if dir_mtime is None:
+            return None
+        if self._key(directory) in self._changed:
+            count("files_stat")
+            try:
+                dir_mtime = os.stat(str(directory)).st_mtime_ns
+            except OSError:
+                return None
+        digest = 0
+        for entry in self._listing(directory).values():
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            h = hashlib.blake2b(f"{entry.name}\0{st.st_size}\0{st.st_mtime_ns}".encode("utf-8"), digest_size=8).digest()
+            digest = (digest + int.from_bytes(h, "little")) & 0xFFFFFFFFFFFFFFFF
+        return [dir_mtime, f"{digest:016x}"]
+
+    def stat(self, path):
+        """列挙時に取得済みの stat 情報を返す (未列挙・未登録なら os.stat)"""
+        entry = self._listing(os.path.dirname(str(path))).get(os.path.basename(str(path)))
+        if entry is None:
+            count("files_stat")
+            return os.stat(path)
+        return entry.stat()
+
+    def exists(self, path):
+        return os.path.basename(str(path)) in self._listing(os.path.dirname(str(path)))
+
+    def add(self, path):
+        """作成・移動したファイル (またはフォルダ) を一覧に反映する"""
+        key = self._key(os.path.dirname(str(path)))
+        listing = self._dirs.get(key)
+        if listing is None: return  # 未列挙のフォルダは次回アクセス時に列挙される
+        self._changed.add(key)
+        count("files_stat")
+        try:
+            listing[os.path.basename(str(path))] = _StatEntry(str(path), os.stat(path))
+        except OSError:
+            pass
+
+    def _remove(self, path):
+        key = self._key(os.path.dirname(str(path)))
+        listing = self._dirs.get(key)
+        if listing is not None:
+            listing.pop(os.path.basename(str(path)), None)
+            self._changed.add(key)
+
+    def discard(self, path):
+        """削除したファイルを一覧から除外する"""
+        count("deleted")
+        self._remove(path)
+
+    def move(self, src, dst):
+        """移動したファイルを一覧に反映する"""
+        count("moved")
+        self._remove(src)
+        self.add(dst)
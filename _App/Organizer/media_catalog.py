@@ -0,0 +1,206 @@
+"""
+メディアカタログ (SQLite)
+
+_Data 以下の画像・動画を相対パスをキーに永続化する。
+毎回の全走査 (rglob + stat) を避け、ディレクトリの mtime が変化したフォルダのみ再走査する。
+動画は MP4 のヘッダーから取得した長さ・解像度・作成日時を (サイズ, mtime) と共に保存し、変化した動画のみ再解析する。
+メディアは日付 (ローカル時刻の YYYY-MM-DD) ごとに読み出せるため、ビューアーは1日分ずつデータを作成できる。
+"""
+import os
+import sqlite3
+import time
+
+CATALOG_FILE = "media_catalog.db"
+CATALOG_VERSION = 3  # 2: ファイル名の日時の解析の修正 (日時を再計算する) / 3: 日付の列を追加
+
+MEDIA_TYPES = {".png": "image", ".jpg": "image", ".jpeg": "image", ".webp": "image", ".mp4": "video"}
+# 走査対象外のフォルダ (ビューアーに表示しない)
+EXCLUDED_DIRS = {"Prompts", "System", "Organizer", "ChromeExtension", "icons", "_App"}
+# 更新直後のフォルダは mtime の分解能 (FAT: 2秒) 内で変更が重なる可能性があるため記録しない
+MTIME_SETTLE_SEC = 2.0
+
+
+def _rel(path, root_dir):
+    return os.path.relpath(path, root_dir).replace("\\", "/")
+
+
+def _day(ts):
+    return time.strftime("%Y-%m-%d", time.localtime(ts))
+
+
+def _list_dir(dir_path, inventory, dir_mtime):
+    """フォルダ直下のエントリ。Inventory が列挙した時点の mtime が dir_mtime (現在の mtime) と異なれば列挙し直す
+
+    他の処理が先に列挙した後でファイルが追加された場合に、古い一覧を新しい mtime で記録しないため。
+    """
+    if inventory is not None and inventory.dir_mtime_ns(dir_path) == dir_mtime:
+        return inventory.entries(dir_path)
+    with os.scandir(dir_path) as it:
+        return list(it)
+
+
+class MediaCatalog:
+    """_Data 以下のメディアファイルの永続カタログ"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = self._connect()
+
+    def _connect(self):
+        try:
+            conn = sqlite3.connect(str(self.db_path))
+            self._init_schema(conn)
+            return conn
+        except sqlite3.DatabaseError:
+            # 破損時は作り直す (カタログはファイルシステムから再構築可能)
+            try: os.remove(self.db_path)
+            except OSError: pass
+            conn = sqlite3.connect(str(self.db_path))
+            self._init_schema(conn)
+            return conn
+
+    def _init_schema(self, conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != CATALOG_VERSION:
+            conn.execute("DROP TABLE IF EXISTS media")
+            conn.execute("DROP TABLE IF EXISTS folders")
+        conn.execute("""CREATE TABLE IF NOT EXISTS media (
+            relpath TEXT PRIMARY KEY, folder TEXT NOT NULL, name TEXT NOT NULL,
+            size INTEGER NOT NULL, mtime REAL NOT NULL, ts REAL NOT NULL,
+            type TEXT NOT NULL, is_favorite INTEGER NOT NULL DEFAULT 0, day TEXT NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS media_folder ON media(folder)")
+        conn.execute("CREATE INDEX IF NOT EXISTS media_day ON media(day, ts)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS folders (
+            folder TEXT PRIMARY KEY, parent TEXT, dir_mtime INTEGER NOT NULL)""")
+        conn.execute("CREATE INDEX IF NOT EXISTS folders_parent ON folders(parent)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS videos (
+            relpath TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL,
+            duration REAL, width INTEGER, height INTEGER, created INTEGER)""")
+        conn.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+        conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def reconcile(self, data_dir, root_dir, timestamp_func, inventory=None):
+        """mtime が変化したフォルダのみ再走査し、カタログを更新する。再走査したフォルダ数を返す
+
+        inventory (Inventory) を渡した場合は他の処理と列挙結果を共有する (一覧の取得後に変更されたフォルダは列挙し直す)。
+        """
+        conn = self.conn
+        stored = dict(conn.execute("SELECT folder, dir_mtime FROM folders"))
+        seen, rescanned = set(), 0
+        now = time.time()
+        stack = [(str(data_dir), None)]
+
+        with conn:
+            while stack:
+                dir_path, parent = stack.pop()
+                rel = _rel(dir_path, root_dir)
+                try:
+                    st = os.stat(dir_path)
+                except OSError:
+                    continue
+                seen.add(rel)
+
+                if stored.get(rel) == st.st_mtime_ns:
+                    # 変更なし: 既知のサブフォルダのみ辿る
+                    for (child,) in conn.execute("SELECT folder FROM folders WHERE parent = ?", (rel,)):
+                        stack.append((os.path.join(root_dir, child), rel))
+                    continue
+
+                rescanned += 1
+                files, subdirs = {}, []
+                try:
+                    for entry in _list_dir(dir_path, inventory, st.st_mtime_ns):
+                        if entry.is_dir(follow_symlinks=False):
+                            if entry.name not in EXCLUDED_DIRS:
+                                subdirs.append(os.path.join(dir_path, entry.name))
+                            continue
+                        media_type = MEDIA_TYPES.get(os.path.splitext(entry.name)[1].lower())
+                        if media_type and entry.is_file():
+                            est = entry.stat()
+                            files[entry.name] = (est.st_size, est.st_mtime, media_type)
+                except OSError:
+                    continue
+
+                existing = {name: (size, mtime) for name, size, mtime in
+                            conn.execute("SELECT name, size, mtime FROM media WHERE folder = ?", (rel,))}
+                removed = [(f"{rel}/{name}",) for name in existing if name not in files]
+                if removed:
+                    conn.executemany("DELETE FROM media WHERE relpath = ?", removed)
+                upserts = []
+                for name, (size, mtime, media_type) in files.items():
+                    if existing.get(name) == (size, mtime): continue
+                    ts = timestamp_func(name, mtime)
+                    upserts.append((f"{rel}/{name}", rel, name, size, mtime, ts, media_type, _day(ts)))
+                if upserts:
+                    conn.executemany("""INSERT INTO media (relpath, folder, name, size, mtime, ts, type, day)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(relpath) DO UPDATE SET size = excluded.size, mtime = excluded.mtime,
+                        ts = excluded.ts, type = excluded.type, day = excluded.day""", upserts)
+
+                # 更新直後のフォルダは次回も再走査させる
+                dir_mtime = st.st_mtime_ns if now - st.st_mtime > MTIME_SETTLE_SEC else -1
+                conn.execute("""INSERT INTO folders (folder, parent, dir_mtime) VALUES (?, ?, ?)
+                    ON CONFLICT(folder) DO UPDATE SET parent = excluded.parent, dir_mtime = excluded.dir_mtime""",
+                             (rel, parent, dir_mtime))
+                stack.extend((p, rel) for p in subdirs)
+
+            # 消滅したフォルダの掃除
+            gone = [(folder,) for folder in stored if folder not in seen]
+            if gone:
+                conn.executemany("DELETE FROM media WHERE folder = ?", gone)
+                conn.executemany("DELETE FROM folders WHERE folder = ?", gone)
+        return rescanned
+
+    def sync_favorites(self, fav_set):
+        """Favoritesフラグを最新の fav_set に合わせる (動画は常にFavorites扱い)"""
+        updates = []
+        for relpath, name, media_type, is_fav in self.conn.execute(
+                "SELECT relpath, name, type, is_favorite FROM media"):
+            fav = 1 if (name in fav_set or media_type == "video") else 0
+            if fav != is_fav:
+                updates.append((fav, relpath))
+        if updates:
+            with self.conn:
+                self.conn.executemany("UPDATE media SET is_favorite = ? WHERE relpath = ?", updates)
+
+    def index_videos(self, root_dir, probe):
+        """未解析・変更された動画を probe(path) -> VideoInfo で解析する。(解析した件数, 解析できなかった件数) を返す"""
+        pending = self.conn.execute("""SELECT m.relpath, m.size, m.mtime FROM media m
+            LEFT JOIN videos v ON v.relpath = m.relpath
+            WHERE m.type = 'video' AND (v.relpath IS NULL OR v.size != m.size OR v.mtime != m.mtime)""").fetchall()
+        rows, failed = [], 0
+        for relpath, size, mtime in pending:
+            info = probe(os.path.join(root_dir, relpath))
+            if info is None:
+                failed += 1
+                rows.append((relpath, size, mtime, None, None, None, None))  # 解析できない動画も記録し、再解析しない
+            else:
+                rows.append((relpath, size, mtime, info.duration, info.width, info.height, info.created))
+        with self.conn:
+            if rows:
+                self.conn.executemany("INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self.conn.execute("DELETE FROM videos WHERE relpath NOT IN (SELECT relpath FROM media)")
+        return len(rows), failed
+
+    def days(self):
+        """メディアのある日付 (YYYY-MM-DD) を新しい順に返す"""
+        return [day for (day,) in self.conn.execute("SELECT DISTINCT day FROM media ORDER BY day DESC")]
+
+    def iter_day(self, day):
+        """日付のメディアを新しい順に (relpath, name, type, ts, is_favorite, duration, width, height) で返す
+
+        動画以外の duration 以降は None。
+        """
+        return self.conn.execute("""SELECT m.relpath, m.name, m.type, m.ts, m.is_favorite, v.duration, v.width, v.height
+            FROM media m LEFT JOIN videos v ON v.relpath = m.relpath WHERE m.day = ? ORDER BY m.ts DESC, m.relpath""",
+                                 (day,))
+
+    def iter_files(self, media_type):
+        """(relpath, size, mtime) を返す"""
+        return self.conn.execute("SELECT relpath, size, mtime FROM media WHERE type = ?", (media_type,))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
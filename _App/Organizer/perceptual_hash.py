@@ -0,0 +1,76 @@
+"""
+知覚ハッシュ (dHash) による類似画像の検出
+
+再エンコード・縮小・形式違い (PNG / JPEG) の画像はバイト単位では一致しないため、
+縮小したグレースケール画像の隣接画素の明暗から 64bit のハッシュ (dHash) を作り、ハミング距離で比較する。
+近傍検索には BK-tree を使い、全ペアの比較 (O(n^2)) を避ける。画像のデコードには Pillow を使用する。
+"""
+
+HASH_SIZE = 8  # 8x8 = 64bit
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def dhash(path, size=HASH_SIZE):
+    """(size+1) x size に縮小したグレースケール画像の、横方向の明暗差を並べたハッシュ"""
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft("L", (size * 8, size * 8))  # JPEG はデコード時に縮小
+        pixels = img.convert("L").resize((size + 1, size), Image.BILINEAR).tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def dhash_worker(path):
+    """プロセスプール用: ハッシュ値を返す (読み込めない場合は None)"""
+    try:
+        return dhash(path)
+    except Exception:
+        return None
+
+
+class BKTree:
+    """ハミング距離の BK-tree
+
+    各ノードの子を「親との距離」で分類しておくと、三角不等式により
+    検索時は d - threshold 〜 d + threshold の距離の子だけを辿ればよい。
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        node = (value, item, {})
+        self.size += 1
+        if self.root is None:
+            self.root = node
+            return
+        current = self.root
+        while True:
+            distance = hamming(value, current[0])
+            child = current[2].get(distance)
+            if child is None:
+                current[2][distance] = node
+                return
+            current = child
+
+    def search(self, value, threshold):
+        """距離が threshold 以内の (距離, item) のリスト"""
+        result = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node_value, item, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= threshold:
+                result.append((distance, item))
+            for child_distance, child in children.items():
+                if distance - threshold <= child_distance <= distance + threshold:
+                    stack.append(child)
+        return result
@@ -0,0 +1,102 @@
+"""
+プロンプトと画像・動画の対応付け (時刻の索引)
+
+メディアの日時 t に対し、t 以前で最も新しいプロンプトを二分探索で求め、t との差が window 以内であれば対応付ける
+(日付をまたぐ場合も対応付く)。該当するプロンプトがない場合のみ、t の後 late 秒以内のプロンプト (保存が数秒遅れたもの) に対応付ける。
+結果はカタログのデータベースに保存し、次回以降は新しい (日時が変わった) メディアと、
+追加・削除されたプロンプトの影響範囲 [プロンプトの日時 - late, プロンプトの日時 + window] にあるメディアのみ対応付け直す。
+"""
+import bisect
+import json
+
+LINK_RULE_VERSION = 2  # 対応付けの規則を変えた場合は全件対応付け直す (2: t 以前のプロンプトを優先)
+
+
+class PromptIndex:
+    """プロンプトの日時 (UNIX秒) の昇順配列"""
+
+    def __init__(self, times):
+        self.times = sorted(set(times))
+
+    def find(self, t, window, late):
+        """日時 t のメディアに対応するプロンプトの日時 (なければ None)
+
+        直前のプロンプトの画像が新しいプロンプトの数秒前に保存された場合も、新しいプロンプトに対応付けない。
+        """
+        times = self.times
+        i = bisect.bisect_right(times, t)
+        if i and t - times[i - 1] <= window: return times[i - 1]
+        if i < len(times) and times[i] <= t + late: return times[i]
+        return None
+
+
+class PromptLinker:
+    """対応付けの結果を MediaCatalog のデータベース (conn) に保存する
+
+    メディアは日付ごとなど任意の単位で link() に渡し (全件を一度に渡す必要はない)、最後に finish() を呼ぶ。
+    """
+
+    def __init__(self, conn, prompt_times, window, late):
+        self.conn = conn
+        conn.execute("""CREATE TABLE IF NOT EXISTS prompt_links (
+            relpath TEXT PRIMARY KEY, ts REAL NOT NULL, prompt_ts REAL)""")
+        conn.execute("CREATE TABLE IF NOT EXISTS linked_prompts (ts REAL PRIMARY KEY)")
+        conn.execute("CREATE TABLE IF NOT EXISTS prompt_link_settings (key TEXT PRIMARY KEY, value TEXT)")
+        conn.commit()
+        self.index = PromptIndex(prompt_times)
+        self.window, self.late = window, late
+        self.settings = json.dumps([LINK_RULE_VERSION, window, late])
+        row = conn.execute("SELECT value FROM prompt_link_settings WHERE key = 'window'").fetchone()
+        self.rebuild = row is None or row[0] != self.settings  # 設定が変わった場合は全件対応付け直す
+        old_prompts = set()
+        if self.rebuild:
+            with conn:
+                conn.execute("DELETE FROM prompt_links")
+        else:
+            old_prompts = {ts for (ts,) in conn.execute("SELECT ts FROM linked_prompts")}
+        self.changed = sorted(old_prompts.symmetric_difference(self.index.times))
+        self.relinked = 0
+
+    def _stored(self, relpaths):
+        stored = {}
+        for i in range(0, len(relpaths), 500):
+            chunk = relpaths[i:i + 500]
+            stored.update((relpath, (ts, prompt_ts)) for relpath, ts, prompt_ts in self.conn.execute(
+                f"SELECT relpath, ts, prompt_ts FROM prompt_links WHERE relpath IN ({','.join('?' * len(chunk))})", chunk))
+        return stored
+
+    def link(self, media):
+        """media: (relpath, ts) のリスト。{relpath: プロンプトの日時 or None} を返す"""
+        stored = self._stored([relpath for relpath, _ in media])
+        window, late, changed = self.window, self.late, self.changed
+        links, updates = {}, []
+        for relpath, ts in media:
+            old = stored.get(relpath)
+            if old is not None and old[0] == ts:
+                # 追加・削除されたプロンプトが [ts - window, ts + late] になければ前回の結果のまま
+                i = bisect.bisect_left(changed, ts - window)
+                if i == len(changed) or changed[i] > ts + late:
+                    links[relpath] = old[1]
+                    continue
+            links[relpath] = self.index.find(ts, window, late)
+            updates.append((relpath, ts, links[relpath]))
+        if updates:
+            with self.conn:
+                self.conn.executemany("INSERT OR REPLACE INTO prompt_links VALUES (?, ?, ?)", updates)
+        self.relinked += len(updates)
+        return links
+
+    def finish(self):
+        """全メディアの対応付け後に呼ぶ。消えたメディアの結果を削除し、プロンプトの一覧と設定を保存する
+
+        途中で中断された場合は一覧・設定が前回のままのため、次回に同じ範囲を対応付け直す。対応付け直した件数を返す。
+        """
+        conn = self.conn
+        with conn:
+            conn.execute("DELETE FROM prompt_links WHERE relpath NOT IN (SELECT relpath FROM media)")
+            if self.rebuild or self.changed:
+                conn.execute("DELETE FROM linked_prompts")
+                conn.executemany("INSERT INTO linked_prompts VALUES (?)", [(ts,) for ts in self.index.times])
+            if self.rebuild:
+                conn.execute("INSERT OR REPLACE INTO prompt_link_settings VALUES ('window', ?)", (self.settings,))
+        return self.relinked
@@ -0,0 +1,112 @@
+"""
+プロンプト履歴の逐次読み込み
+
+プロンプトファイル (prompt_*.txt / All_Prompts_Merged.txt) は次の形式のエントリの並び。
+
+    [YYYY/MM/DD HH:MM:SS]
+    本文 (複数行可)
+    ------------------------------------
+
+ファイル全体を読み込まず1行ずつ解析し、エントリを1件ずつ返す (数百MBの履歴でもメモリ使用量は一定)。
+日時の行は正規表現・strptime を使わずに分解する。
+"""
+from collections import namedtuple
+from datetime import datetime
+
+# time: UNIX秒 / date_str: ファイル上の表記 (YYYY/MM/DD HH:MM:SS) / day: 日付 (YYYY-MM-DD)
+# content: 本文 (前後の空白を除去) / offset: 日時の行のファイル上の位置 (バイト)
+PromptRecord = namedtuple("PromptRecord", "time date_str day content offset")
+
+SEPARATOR = b"-" * 20  # 区切り線 ('-' が20個以上で始まる行)
+BOM = b"\xef\xbb\xbf"
+MERGED_HEADER = "GrokSaver Prompt History (Merged)\n====================================\n\n"
+
+
+_dates = {}  # 'YYYY/MM/DD' -> (年, 月, 日, 'YYYY-MM-DD')。同じ日付のエントリが続くため検査は日付ごとに1回
+
+
+def _parse_date(date):
+    cached = _dates.get(date)
+    if cached is None:
+        parts = date.split("/")
+        if len(parts) != 3: return None
+        y, mo, d = parts
+        if not (len(y) == 4 and 0 < len(mo) <= 2 and 0 < len(d) <= 2 and (y + mo + d).isdecimal()): return None
+        try:
+            dt = datetime(int(y), int(mo), int(d))
+        except ValueError:
+            return None
+        cached = _dates[date] = (dt.year, dt.month, dt.day, f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}")
+    return cached
+
+
+def parse_header(line):
+    """'[YYYY/MM/DD HH:MM:SS]' の行なら (UNIX秒, 'YYYY/MM/DD HH:MM:SS', 'YYYY-MM-DD')、それ以外は None
+
+    月・日・時は1桁も可。存在しない日時 (13月など) は None。
+    """
+    line = line.rstrip()
+    if line[:1] != "[" or line[-1:] != "]": return None
+    stamp = line[1:-1]
+    date, sep, clock = stamp.partition(" ")
+    date = _parse_date(date) if sep else None
+    if date is None: return None
+    hms = clock.split(":")
+    if len(hms) != 3: return None
+    h, mi, s = hms
+    if not (0 < len(h) <= 2 and len(mi) == 2 and len(s) == 2 and (h + mi + s).isdecimal()): return None
+    try:
+        dt = datetime(date[0], date[1], date[2], int(h), int(mi), int(s))
+    except ValueError:
+        return None
+    return dt.timestamp(), stamp, date[3]
+
+
+def _decode_body(lines):
+    text = b"".join(lines).decode("utf-8", errors="replace")
+    if "\r" in text:
+        text = "\n".join(line.rstrip("\r") for line in text.split("\n"))
+    return text.strip()
+
+
+def iter_prompts(f):
+    """バイナリで開いたファイルを現在位置から1件ずつ読み、PromptRecord を返す
+
+    必要な件数だけ読めばよく、残りは読まない (offset の位置から続きをコピーできる)。
+    区切り線がないまま次の日時の行が現れた場合は、区切り線までを本文とみなす (従来の形式と同じ)。
+    本文は行ごとではなくエントリごとにまとめてデコードする。
+    """
+    header, start, lines = None, 0, []
+    pos = f.tell()
+    for raw in f:
+        if pos == 0 and raw.startswith(BOM):
+            raw = raw[len(BOM):]
+            pos = len(BOM)
+        if header is not None:
+            if raw.startswith(SEPARATOR):
+                yield PromptRecord(header[0], header[1], header[2], _decode_body(lines), start)
+                header = None
+            else:
+                lines.append(raw)
+        elif raw.startswith(b"["):
+            header = parse_header(raw.decode("utf-8", errors="replace"))
+            if header is not None: start, lines = pos, []
+        pos += len(raw)
+    if header is not None:
+        yield PromptRecord(header[0], header[1], header[2], _decode_body(lines), start)
+
+
+def read_prompts(path):
+    """ファイルのエントリを1件ずつ返す (読み込めないファイルは何も返さない)"""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return
+    with f:
+        yield from iter_prompts(f)
+
+
+def read_prompt_at(f, offset):
+    """バイナリで開いたファイルの offset (PromptRecord.offset) にあるエントリを1件読む (なければ None)"""
+    f.seek(offset)
+    return next(iter_prompts(f), None)
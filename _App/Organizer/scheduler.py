@@ -0,0 +1,128 @@
+"""
+処理 (stage) の依存関係に基づく並行実行
+
+各処理は依存する処理 (requires) がすべて完了した時点でスレッドで開始する。
+依存関係のない処理 (動画移動・プロンプト統合・Favorites統合など) は同時に実行されるため、
+全体の所要時間は各処理の合計ではなく、依存関係の最長経路 (クリティカルパス) に近づく。
+
+並行実行中の出力は処理ごとにバッファし、開始順に表示する
+(先頭の処理はそのまま表示し、それ以外は先頭の処理が終わった時点でまとめて表示する)。
+"""
+import sys
+import threading
+from collections import namedtuple
+
+# name: 処理名 / func: func(results) -> 戻り値 (results は完了した処理名 -> 戻り値) / requires: 依存する処理名
+Stage = namedtuple("Stage", "name func requires")
+
+_local = threading.local()
+
+
+class _StageConsole:
+    """sys.stdout の代わりに使う、処理ごとに出力を振り分けるストリーム"""
+
+    def __init__(self, real):
+        self.real = real
+        self._lock = threading.Lock()
+        self._order = []  # 出力を表示し終えていない処理 (開始順)。先頭の処理のみ直接表示する
+        self._buffers = {}
+        self._done = set()
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+    def write(self, text):
+        name = getattr(_local, "stage", None)
+        with self._lock:
+            if name is None or not self._order or self._order[0] == name:
+                return self.real.write(text)
+            self._buffers[name].append(text)
+            return len(text)
+
+    def flush(self):
+        self.real.flush()
+
+    def begin(self, name):
+        with self._lock:
+            self._order.append(name)
+            self._buffers[name] = []
+
+    def end(self, name):
+        with self._lock:
+            self._done.add(name)
+            # 先頭の処理が終わったら、次の処理のバッファを表示して直接表示に切り替える
+            while self._order and self._order[0] in self._done:
+                self._buffers.pop(self._order.pop(0), None)
+                if self._order:
+                    buffered = self._buffers[self._order[0]]
+                    self.real.write("".join(buffered))
+                    buffered.clear()
+            self.real.flush()
+
+
+class StageScheduler:
+    """依存関係を宣言した処理をスレッドで並行実行する"""
+
+    def __init__(self, recorder=None, inventory=None, max_workers=None):
+        self.recorder = recorder
+        self.inventory = inventory
+        self.max_workers = max_workers
+        self.stages = []
+
+    def add(self, name, func, requires=()):
+        known = {stage.name for stage in self.stages}
+        missing = [req for req in requires if req not in known]
+        if missing:
+            raise ValueError(f"{name}: 未登録の処理に依存しています: {', '.join(missing)}")
+        self.stages.append(Stage(name, func, tuple(requires)))
+
+    def _run_stage(self, stage, results, console):
+        _local.stage = stage.name
+        try:
+            if self.recorder is None:
+                return stage.func(results)
+            with self.recorder.stage(stage.name, self.inventory):
+                return stage.func(results)
+        finally:
+            _local.stage = None
+            console.end(stage.name)
+
+    def run(self):
+        """全処理を実行し、{処理名: 戻り値} を返す
+
+        失敗した処理に依存する処理は実行しない。依存関係のない処理は最後まで実行し、最初の例外を送出する。
+        """
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+        results, errors, skipped = {}, [], set()
+        pending = list(self.stages)
+        running = {}
+        console = _StageConsole(sys.stdout)
+        sys.stdout = console
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers or max(len(self.stages), 1)) as executor:
+                while pending or running:
+                    # 依存する処理が完了したものから開始する (宣言順)
+                    for stage in list(pending):
+                        if any(req in skipped for req in stage.requires):
+                            pending.remove(stage)
+                            skipped.add(stage.name)
+                        elif all(req in results for req in stage.requires):
+                            if self.max_workers and len(running) >= self.max_workers: break
+                            pending.remove(stage)
+                            console.begin(stage.name)
+                            running[executor.submit(self._run_stage, stage, results, console)] = stage
+                    if not running: break
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        stage = running.pop(future)
+                        try:
+                            results[stage.name] = future.result()
+                        except Exception as e:
+                            errors.append(e)
+                            skipped.add(stage.name)
+        finally:
+            sys.stdout = console.real
+        if errors:
+            raise errors[0]
+        return results
@@ -0,0 +1,100 @@
+"""
+プロンプト検索用の転置インデックス
+
+英数字は単語単位、日本語などの CJK 文字列は単語境界がないため 2文字単位 (bi-gram) でトークン化する。
+ビューアー側 (JavaScript) の tokenize() と同じ規則でトークン化すること。
+"""
+import json
+from array import array
+
+WRITE_BATCH = 4096  # docs を書き出す単位 (件)
+
+# ひらがな・カタカナ・CJK統合漢字 (拡張A含む)・互換漢字・ハングル・半角カナ
+CJK_RANGES = ((0x3040, 0x30FF), (0x3400, 0x4DBF), (0x4E00, 0x9FFF),
+              (0xF900, 0xFAFF), (0xAC00, 0xD7AF), (0xFF66, 0xFF9F))
+
+
+def _is_cjk(ch):
+    code = ord(ch)
+    for lo, hi in CJK_RANGES:
+        if lo <= code <= hi: return True
+    return False
+
+
+def tokenize(text):
+    """テキストをトークン集合に変換する (小文字化・英数字は単語・CJK は bi-gram)"""
+    tokens = set()
+    word, cjk = [], []
+
+    def flush_word():
+        if word: tokens.add("".join(word))
+        word.clear()
+
+    def flush_cjk():
+        if len(cjk) == 1:
+            tokens.add(cjk[0])
+        for i in range(len(cjk) - 1):
+            tokens.add(cjk[i] + cjk[i + 1])
+        cjk.clear()
+
+    for ch in text.lower():
+        if _is_cjk(ch):
+            flush_word()
+            cjk.append(ch)
+        elif ch.isalnum():
+            flush_cjk()
+            word.append(ch)
+        else:
+            flush_word()
+            flush_cjk()
+    flush_word()
+    flush_cjk()
+    return tokens
+
+
+class SearchIndexBuilder:
+    """日付ごとに add_day() で追加し、検索インデックスを作成する (タイムライン全体を保持しない)
+
+    dates: 追加した日付 (新しい順に追加する)
+    docs: 文書ID -> [日付の番号, グループ番号] (日付の新しい順に採番するため、日付範囲は ID 範囲になる)
+    terms: トークン -> 文書IDの差分符号化リスト
+    文書ID は整数の配列 (array) に保持し、write() で JSON に書き出す。
+    """
+
+    def __init__(self):
+        self.dates = []
+        self.docs = array("I")  # [日付の番号, グループ番号] を平坦に並べる
+        self.postings = {}  # トークン -> 文書IDの配列
+
+    def add_day(self, date, groups):
+        date_idx = len(self.dates)
+        self.dates.append(date)
+        for group_idx, group in enumerate(groups):
+            prompt = group.get('prompt')
+            if not prompt or not prompt.get('content'): continue
+            doc_id = len(self.docs) // 2
+            self.docs.extend((date_idx, group_idx))
+            # トークンの出現順を実行ごとに変えない (set の順序は実行ごとに異なるため、出力が毎回変わってしまう)
+            for token in sorted(tokenize(prompt['content'])):
+                ids = self.postings.get(token)
+                if ids is None:
+                    ids = self.postings[token] = array("I")
+                ids.append(doc_id)
+
+    def write(self, out):
+        """{"dates": [...], "docs": [...], "terms": {...}} を out に少しずつ書き出す"""
+        docs = self.docs
+        out.write('{"dates":')
+        out.write(json.dumps(self.dates))
+        out.write(',"docs":[')
+        for start in range(0, len(docs), WRITE_BATCH * 2):
+            if start: out.write(",")
+            out.write(",".join(f"[{docs[i]},{docs[i + 1]}]" for i in range(start, min(start + WRITE_BATCH * 2, len(docs)), 2)))
+        out.write('],"terms":{')
+        for n, (token, ids) in enumerate(self.postings.items()):
+            prev, encoded = 0, []
+            for doc_id in ids:
+                encoded.append(doc_id - prev)
+                prev = doc_id
+            out.write(f"{',' if n else ''}{json.dumps(token, ensure_ascii=False)}:[{','.join(map(str, encoded))}]")
+        out.write("}}")
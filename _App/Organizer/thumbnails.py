@@ -0,0 +1,102 @@
+"""
+ビューアー一覧用サムネイル (WebP) の差分生成
+
+元画像のサイズ・mtime を thumbnails.db に記録し、変化した画像のみ再生成する。
+元画像が消えたサムネイルは削除する。画像の縮小には Pillow を使用する (未導入時はスキップ)。
+"""
+import os
+import sqlite3
+
+THUMB_DB_FILE = "thumbnails.db"
+THUMB_WIDTH = 400  # グリッド表示 (200px) の高DPI表示を考慮して2倍
+THUMB_QUALITY = 80
+
+
+def pillow_available():
+    try:
+        import PIL.Image  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def thumbnail_relpath(relpath, thumb_rel_dir):
+    """元画像の相対パス (_Data/Images/...) からサムネイルの相対パスを返す"""
+    sub = relpath.split("/", 1)[1] if relpath.startswith("_Data/") else relpath
+    return f"{thumb_rel_dir}/{sub}.webp"
+
+
+def make_thumbnail(job):
+    """プロセスプール用: (src, dst) を縮小して WebP で保存する。成否を返す"""
+    src, dst = job
+    try:
+        from PIL import Image
+        with Image.open(src) as img:
+            img.draft("RGB", (THUMB_WIDTH, THUMB_WIDTH))  # JPEG はデコード時に縮小
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+            if img.width > THUMB_WIDTH:
+                img = img.resize((THUMB_WIDTH, max(1, round(img.height * THUMB_WIDTH / img.width))), Image.LANCZOS)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = dst + ".tmp"
+            img.save(tmp, "WEBP", quality=THUMB_QUALITY, method=4)
+        os.replace(tmp, dst)
+        return True
+    except Exception:
+        return False
+
+
+class ThumbnailCache:
+    """生成済みサムネイルと元画像のサイズ・mtime の対応表"""
+
+    def __init__(self, root_dir, thumb_dir):
+        self.root_dir = str(root_dir)
+        self.thumb_dir = thumb_dir
+        self.thumb_rel_dir = os.path.relpath(thumb_dir, root_dir).replace("\\", "/")
+        os.makedirs(thumb_dir, exist_ok=True)
+        self.conn = sqlite3.connect(str(os.path.join(thumb_dir, THUMB_DB_FILE)))
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS thumbs (
+            relpath TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime REAL NOT NULL, ok INTEGER NOT NULL)""")
+        self.conn.commit()
+        self.records = {row[0]: row[1:] for row in self.conn.execute("SELECT relpath, size, mtime, ok FROM thumbs")}
+
+    def _abs(self, relpath):
+        return os.path.join(self.root_dir, *relpath.split("/"))
+
+    def plan(self, sources):
+        """sources: [(relpath, size, mtime)]。(生成が必要なジョブ, 最新のサムネイルがある relpath の集合) を返す"""
+        jobs, ready = [], set()
+        for relpath, size, mtime in sources:
+            rec = self.records.get(relpath)
+            if rec is not None and rec[0] == size and rec[1] == mtime:
+                if rec[2]: ready.add(relpath)
+                continue
+            jobs.append((relpath, size, mtime))
+        return jobs, ready
+
+    def job_args(self, job):
+        relpath = job[0]
+        return self._abs(relpath), self._abs(thumbnail_relpath(relpath, self.thumb_rel_dir))
+
+    def record(self, job, ok):
+        relpath, size, mtime = job
+        self.records[relpath] = (size, mtime, 1 if ok else 0)
+        self.conn.execute("INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?)", (relpath, size, mtime, 1 if ok else 0))
+
+    def collect_garbage(self, valid_relpaths):
+        """元画像が存在しないサムネイルを削除する。削除件数を返す"""
+        orphans = [r for r in self.records if r not in valid_relpaths]
+        for relpath in orphans:
+            try: os.remove(self._abs(thumbnail_relpath(relpath, self.thumb_rel_dir)))
+            except OSError: pass
+            del self.records[relpath]
+        if orphans:
+            self.conn.executemany("DELETE FROM thumbs WHERE relpath = ?", [(r,) for r in orphans])
+        return len(orphans)
+
+    def url(self, relpath):
+        return thumbnail_relpath(relpath, self.thumb_rel_dir)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
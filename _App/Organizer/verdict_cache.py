@@ -0,0 +1,146 @@
+"""
+ファイル単位の判定キャッシュ (SQLite)
+
+(パス, サイズ, mtime) をキーに、解像度・カラーモード・ハッシュ・知覚ハッシュ (dHash)・判定結果を保存する。
+サイズまたは mtime が変化したファイルは再検査し、消えたファイルのエントリは削除する。
+"""
+import os
+import sqlite3
+
+CACHE_FILE = "verdict_cache.db"
+CACHE_VERSION = 2
+
+KEEP, DELETE = "keep", "delete"
+
+
+class VerdictCache:
+    """画像クリーニング / 重複チェック用のファイル単位キャッシュ"""
+
+    def __init__(self, db_path, base_dir):
+        self.db_path = db_path
+        self.base_dir = str(base_dir)
+        self.records = {}
+        self.folders = {}  # フォルダ -> ファイル名の集合 (フォルダ単位の削除で全件を走査しないため)
+        self.dirty = set()
+        self.removed = set()
+        try:
+            self.conn = self._connect()
+        except sqlite3.DatabaseError:
+            # 破損時は作り直す (キャッシュは再計算可能)
+            try: os.remove(db_path)
+            except OSError: pass
+            self.conn = self._connect()
+        for row in self.conn.execute("SELECT relpath, size, mtime_ns, width, height, mode, "
+                                     "partial_hash, full_hash, verdict, dhash FROM files"):
+            self.records[row[0]] = list(row[1:])
+            self._index(row[0])
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path))
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version == 1:
+            # v1 -> v2: dhash 列の追加のみ (既存の判定結果はそのまま使う)
+            conn.execute("ALTER TABLE files ADD COLUMN dhash TEXT")
+        elif version != CACHE_VERSION:
+            conn.execute("DROP TABLE IF EXISTS files")
+        conn.execute("""CREATE TABLE IF NOT EXISTS files (
+            relpath TEXT PRIMARY KEY, folder TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+            width INTEGER, height INTEGER, mode TEXT, partial_hash TEXT, full_hash TEXT, verdict TEXT, dhash TEXT)""")
+        conn.execute(f"PRAGMA user_version = {CACHE_VERSION}")
+        conn.commit()
+        return conn
+
+    def _key(self, path):
+        return os.path.relpath(path, self.base_dir).replace("\\", "/")
+
+    def _index(self, key):
+        folder, _, name = key.rpartition("/")
+        self.folders.setdefault(folder, set()).add(name)
+
+    def _remove(self, key):
+        del self.records[key]
+        folder, _, name = key.rpartition("/")
+        names = self.folders.get(folder)
+        if names is not None:
+            names.discard(name)
+            if not names: del self.folders[folder]
+        self.dirty.discard(key)
+        self.removed.add(key)
+
+    def _record(self, path, size, mtime_ns):
+        """サイズと mtime が一致する場合のみ既存レコードを返し、不一致なら新規レコードに差し替える"""
+        key = self._key(path)
+        rec = self.records.get(key)
+        if rec is None or rec[0] != size or rec[1] != mtime_ns:
+            if rec is None: self._index(key)
+            rec = [size, mtime_ns, None, None, None, None, None, None, None]
+            self.records[key] = rec
+            self.dirty.add(key)
+        return key, rec
+
+    def get_probe(self, path, size, mtime_ns):
+        """キャッシュ済みの (width, height, mode, verdict) を返す。未検査なら None"""
+        rec = self.records.get(self._key(path))
+        if rec is None or rec[0] != size or rec[1] != mtime_ns or rec[7] is None:
+            return None
+        return rec[2], rec[3], rec[4], rec[7]
+
+    def set_probe(self, path, size, mtime_ns, probed, verdict):
+        key, rec = self._record(path, size, mtime_ns)
+        rec[2], rec[3], rec[4] = probed if probed else (None, None, None)
+        rec[7] = verdict
+        self.dirty.add(key)
+
+    def get_hash(self, path, size, mtime_ns, kind):
+        rec = self.records.get(self._key(path))
+        if rec is None or rec[0] != size or rec[1] != mtime_ns:
+            return None
+        return rec[5] if kind == "partial" else rec[6]
+
+    def set_hash(self, path, size, mtime_ns, kind, value):
+        key, rec = self._record(path, size, mtime_ns)
+        rec[5 if kind == "partial" else 6] = value
+        self.dirty.add(key)
+
+    def get_dhash(self, path, size, mtime_ns):
+        """キャッシュ済みの知覚ハッシュ (int)。未計算なら None"""
+        rec = self.records.get(self._key(path))
+        if rec is None or rec[0] != size or rec[1] != mtime_ns or rec[8] is None:
+            return None
+        return int(rec[8], 16)
+
+    def set_dhash(self, path, size, mtime_ns, value):
+        key, rec = self._record(path, size, mtime_ns)
+        rec[8] = f"{value:016x}"
+        self.dirty.add(key)
+
+    def discard(self, path):
+        key = self._key(path)
+        if key in self.records: self._remove(key)
+        self.dirty.discard(key)
+
+    def prune_folder(self, folder, existing_names):
+        """走査したフォルダについて、存在しないファイルのエントリを削除する"""
+        folder = self._key(folder)
+        for name in self.folders.get(folder, set()) - set(existing_names):
+            self._remove(f"{folder}/{name}")
+
+    def prune_folders(self, existing_folders):
+        """存在しないフォルダのエントリを削除する"""
+        keep = {self._key(d) for d in existing_folders}
+        for folder in [f for f in self.folders if f not in keep]:
+            for name in list(self.folders[folder]):
+                self._remove(f"{folder}/{name}" if folder else name)
+
+    def save(self):
+        with self.conn:
+            if self.removed:
+                self.conn.executemany("DELETE FROM files WHERE relpath = ?", [(k,) for k in self.removed])
+            if self.dirty:
+                self.conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      [(k, k.rsplit("/", 1)[0], *self.records[k]) for k in self.dirty])
+        self.removed.clear()
+        self.dirty.clear()
+
+    def close(self):
+        self.conn.close()
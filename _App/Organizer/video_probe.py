@@ -0,0 +1,105 @@
+"""
+動画 (MP4) のヘッダー解析
+
+ffmpeg などの外部ツールを使わず、MP4 の moov ボックス内の mvhd (長さ・作成日時) と
+tkhd (映像トラックの幅・高さ) のみを読む。先頭のボックスはヘッダーだけを読んで読み飛ばすため、
+moov がファイル末尾にある場合でも mdat (映像データ本体) は読み込まない。
+"""
+import struct
+from collections import namedtuple
+
+# duration: 秒 / width, height: 表示サイズ (回転を反映) / created: UNIX秒 (記録がなければ None)
+VideoInfo = namedtuple("VideoInfo", "duration width height created")
+
+MP4_EPOCH_OFFSET = 2082844800  # 1904-01-01 から 1970-01-01 までの秒数
+MAX_MOOV_SIZE = 32 * 1024 * 1024  # これより大きい moov は解析しない (断片化 MP4 など)
+
+
+def _boxes(buf, start, end):
+    """buf[start:end] 内のボックスを (type, 本体の開始位置, 本体の終了位置) で返す"""
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end: return
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end: return
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def _parse_mvhd(buf, start):
+    if buf[start] == 1:
+        created, _, timescale, duration = struct.unpack_from(">QQIQ", buf, start + 4)
+        unknown = 0xFFFFFFFFFFFFFFFF
+    else:
+        created, _, timescale, duration = struct.unpack_from(">IIII", buf, start + 4)
+        unknown = 0xFFFFFFFF
+    seconds = duration / timescale if timescale and duration != unknown else None
+    created = created - MP4_EPOCH_OFFSET if created > MP4_EPOCH_OFFSET else None
+    return seconds, created
+
+
+def _parse_tkhd(buf, start):
+    """映像トラックの (幅, 高さ)。音声トラックなど幅・高さがないトラックは None"""
+    # version 0: 作成・更新日時 (各4) + track_ID (4) + 予約 (4) + duration (4) / version 1: 日時・duration が各8
+    offset = start + 4 + (32 if buf[start] == 1 else 20)
+    # 予約 (8) + layer, alternate_group, volume, 予約 (各2) の後に変換行列 (9 x 4) と幅・高さ (16.16 固定小数点)
+    a, b = struct.unpack_from(">ii", buf, offset + 16)
+    width, height = struct.unpack_from(">II", buf, offset + 52)
+    width, height = width >> 16, height >> 16
+    if not width or not height: return None
+    if a == 0 and abs(b) == 0x10000:
+        width, height = height, width  # 90度 / 270度回転
+    return width, height
+
+
+def probe_mp4(path):
+    """VideoInfo を返す。MP4 として解析できない場合は None"""
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, 2)
+            file_size = f.tell()
+            pos = 0
+            while pos + 8 <= file_size:
+                f.seek(pos)
+                head = f.read(16)
+                if len(head) < 8: return None
+                size, box_type = struct.unpack_from(">I4s", head)
+                header = 8
+                if size == 1:
+                    if len(head) < 16: return None
+                    size = struct.unpack_from(">Q", head, 8)[0]
+                    header = 16
+                elif size == 0:
+                    size = file_size - pos
+                if size < header: return None
+                if box_type == b"moov":
+                    if size > MAX_MOOV_SIZE: return None
+                    f.seek(pos + header)
+                    return _parse_moov(f.read(size - header))
+                pos += size
+    except (OSError, struct.error, IndexError):
+        return None
+    return None
+
+
+def _parse_moov(buf):
+    duration = created = None
+    dimensions = None
+    for box_type, start, end in _boxes(buf, 0, len(buf)):
+        if box_type == b"mvhd":
+            duration, created = _parse_mvhd(buf, start)
+        elif box_type == b"trak" and dimensions is None:
+            for child_type, child_start, _ in _boxes(buf, start, end):
+                if child_type == b"tkhd":
+                    dimensions = _parse_tkhd(buf, child_start)
+                    break
+    if duration is None and dimensions is None:
+        return None
+    width, height = dimensions or (None, None)
+    return VideoInfo(duration, width, height, created)
@@ -0,0 +1,57 @@
+"""
+ビューアー用の日付データ (YYYY-MM-DD.js) の列形式エンコード
+
+メディアごとに {"type", "name", "time", "path", "thumb", "is_favorite"} を並べると、
+キー名とフォルダのパスが件数分繰り返されるため、フォルダを共通化し、項目ごとの配列 (列) に分けて出力する。
+
+    dirs:      フォルダの相対パス (日付内で共通化)
+    thumbDirs: dirs に対応するサムネイルのフォルダ (サムネイルがなければ null)
+    groups:    [メディア件数] または [メディア件数, プロンプトの日時 (UNIX秒), プロンプト本文]
+    dir / name / time / flags: メディアごとの列 (groups の順に連続して並ぶ)
+        time:  UNIX秒 (整数) の差分符号化 (直前のメディアとの差)
+        flags: FLAG_VIDEO | FLAG_FAVORITE | FLAG_THUMB
+    videos:    動画ごとの [長さ (秒), 幅, 高さ] (FLAG_VIDEO のメディアの順。不明な値は null)
+
+ビューアー側 (JavaScript) の grokViewerShard() と同じ形式であること。
+"""
+
+FLAG_VIDEO = 1
+FLAG_FAVORITE = 2
+FLAG_THUMB = 4  # サムネイルあり (thumbDirs[dir]/name.webp)
+
+
+def encode_day(groups):
+    """1日分のグループのリストを列形式の dict に変換する"""
+    dirs, dir_index, thumb_dirs = [], {}, []
+    encoded_groups = []
+    dir_col, name_col, time_col, flags_col, videos = [], [], [], [], []
+    prev_time = 0
+    for group in groups:
+        prompt, media = group.get('prompt'), group['media']
+        encoded_groups.append([len(media), int(prompt['time']), prompt['content']] if prompt else [len(media)])
+        for m in media:
+            folder, _, name = m['path'].rpartition('/')
+            d = dir_index.get(folder)
+            if d is None:
+                d = dir_index[folder] = len(dirs)
+                dirs.append(folder)
+                thumb_dirs.append(None)
+            flags = (FLAG_VIDEO if m['type'] == 'video' else 0) | (FLAG_FAVORITE if m.get('is_favorite') else 0)
+            thumb = m.get('thumb')
+            if thumb:
+                # サムネイルはフォルダ単位で同じ場所にあるため、フォルダごとに1回だけ出力する
+                suffix = f"/{name}.webp"
+                if thumb.endswith(suffix) and thumb_dirs[d] in (None, thumb[:-len(suffix)]):
+                    thumb_dirs[d] = thumb[:-len(suffix)]
+                    flags |= FLAG_THUMB
+            if flags & FLAG_VIDEO:
+                duration = m.get('duration')
+                videos.append([round(duration, 1) if duration is not None else None, m.get('width'), m.get('height')])
+            ts = int(m['time'])
+            dir_col.append(d)
+            name_col.append(name)
+            time_col.append(ts - prev_time)
+            flags_col.append(flags)
+            prev_time = ts
+    return {"dirs": dirs, "thumbDirs": thumb_dirs, "groups": encoded_groups,
+            "dir": dir_col, "name": name_col, "time": time_col, "flags": flags_col, "videos": videos}
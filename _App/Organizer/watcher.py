@@ -0,0 +1,189 @@
+"""
+フォルダ監視 (常駐モード用)
+
+watchdog ライブラリが利用可能な場合は OS のファイル変更通知 (inotify / ReadDirectoryChangesW 等) を使い、
+未導入の場合や監視開始に失敗したフォルダは os.scandir による軽量なポーリングで代替する。
+変更は監視対象 (key) 単位でまとめ、一定時間変更が止まってから (デバウンス) 通知する。
+"""
+import os
+import threading
+import time
+from collections import namedtuple
+
+POLL_INTERVAL_SEC = 1.0
+DEBOUNCE_SEC = 3.0
+# 更新直後のフォルダは mtime の分解能内で変更が重なる可能性があるため、次回も再列挙する
+MTIME_SETTLE_SEC = 2.0
+# Chrome がダウンロード中に使う一時ファイル
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+# key: 通知名 / directory: 監視フォルダ / file_filter: 対象ファイル名の判定
+# subdir_filter: 指定時は1階層下のサブフォルダ (例: Images/YYYYMMDD) も監視 / track_removals: 削除も変更として扱う
+WatchTarget = namedtuple("WatchTarget", "key directory file_filter subdir_filter track_removals",
+                         defaults=(None, False))
+
+
+def watchdog_available():
+    try:
+        import watchdog.observers  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _is_partial(name):
+    return name.lower().endswith(PARTIAL_SUFFIXES)
+
+
+class ChangeWatcher:
+    """監視対象ごとの変更を集約し、デバウンス後に通知する"""
+
+    def __init__(self, targets, use_watchdog=True):
+        self.targets = list(targets)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._observer = None
+        self._polled = []
+        self._dir_state = {}  # 監視フォルダ -> (dir_mtime_ns, {ファイル名: (サイズ, mtime)}, サブフォルダ)
+
+        if use_watchdog and watchdog_available():
+            self._polled = self._start_observer()
+        else:
+            self._polled = list(self.targets)
+        for target in self._polled:
+            self._poll_target(target, initial=True)
+
+    @property
+    def backend(self):
+        if self._observer is None: return "polling"
+        if self._polled: return "watchdog + polling"
+        return "watchdog"
+
+    def _start_observer(self):
+        """watchdog の監視を開始する。監視できなかった対象を返す (ポーリングで代替)"""
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def __init__(self, target):
+                self.target = target
+
+            def on_any_event(self, event):
+                if event.event_type in ("opened", "closed", "closed_no_write"): return
+                # フォルダの modified はファイルの追加・削除に伴うもの (ファイル側のイベントで判定する)
+                if event.is_directory and event.event_type == "modified": return
+                removed = event.event_type in ("deleted", "moved")
+                if watcher._match(self.target, event.src_path, event.is_directory):
+                    if not removed or self.target.track_removals:
+                        watcher.mark(self.target.key)
+                dest = getattr(event, "dest_path", "")
+                if dest and watcher._match(self.target, dest, event.is_directory):
+                    watcher.mark(self.target.key)
+
+        observer, failed = Observer(), []
+        for target in self.targets:
+            try:
+                observer.schedule(_Handler(target), str(target.directory),
+                                  recursive=target.subdir_filter is not None)
+            except Exception:
+                failed.append(target)
+        if len(failed) == len(self.targets):
+            return failed
+        observer.daemon = True
+        observer.start()
+        self._observer = observer
+        return failed
+
+    def _match(self, target, path, is_directory):
+        """イベントのパスが監視対象に該当するか"""
+        rel = os.path.relpath(path, target.directory)
+        parts = rel.replace("\\", "/").split("/")
+        if parts[0] in (".", ".."): return False
+        if is_directory:
+            # 日付フォルダ自体の作成・削除
+            return len(parts) == 1 and target.subdir_filter is not None and bool(target.subdir_filter(parts[0]))
+        if len(parts) == 2 and target.subdir_filter is not None and not target.subdir_filter(parts[0]):
+            return False
+        if len(parts) > 2 or (len(parts) == 2 and target.subdir_filter is None):
+            return False
+        return not _is_partial(parts[-1]) and bool(target.file_filter(parts[-1]))
+
+    def _poll_dir(self, directory, target, initial, with_subdirs=False):
+        """フォルダの mtime が変化した場合のみ再列挙し、対象ファイルの署名を比較する。変化があれば True"""
+        key = os.path.normcase(str(directory))
+        prev = self._dir_state.get(key)
+        try:
+            st = os.stat(directory)
+        except OSError:
+            self._dir_state.pop(key, None)
+            return bool(prev and prev[1]) and target.track_removals
+        if prev is not None and prev[0] == st.st_mtime_ns:
+            return False
+
+        files, subdirs = {}, []
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if with_subdirs and entry.is_dir():
+                        if target.subdir_filter(entry.name): subdirs.append(entry.path)
+                        continue
+                    if _is_partial(entry.name) or not target.file_filter(entry.name): continue
+                    try:
+                        est = entry.stat()
+                        files[entry.name] = (est.st_size, est.st_mtime_ns)
+                    except OSError:
+                        pass
+        except OSError:
+            return False
+
+        # 更新直後は同じ mtime のまま変更が続く可能性があるため、次回も再列挙させる
+        dir_mtime = st.st_mtime_ns if time.time() - st.st_mtime > MTIME_SETTLE_SEC else -1
+        self._dir_state[key] = (dir_mtime, files, subdirs)
+        if initial: return False
+        old_files = prev[1] if prev else {}
+        if any(old_files.get(name) != sig for name, sig in files.items()): return True
+        return target.track_removals and any(name not in files for name in old_files)
+
+    def _poll_target(self, target, initial=False):
+        with_subdirs = target.subdir_filter is not None
+        root_key = os.path.normcase(str(target.directory))
+        old_subdirs = self._dir_state.get(root_key, (0, {}, []))[2]
+        changed = self._poll_dir(target.directory, target, initial, with_subdirs)
+        if with_subdirs:
+            subdirs = self._dir_state.get(root_key, (0, {}, []))[2]
+            for sub in subdirs:
+                if self._poll_dir(sub, target, initial): changed = True
+            # 消えたサブフォルダ
+            for sub in set(old_subdirs) - set(subdirs):
+                state = self._dir_state.pop(os.path.normcase(sub), None)
+                if state and state[1] and target.track_removals: changed = True
+        if changed:
+            self.mark(target.key)
+
+    def mark(self, key):
+        """変更ありとして記録する (デバウンス時間が延長される)"""
+        with self._lock:
+            self._pending[key] = time.monotonic()
+
+    def wait(self, stop_event=None):
+        """変更が落ち着いた監視対象の key の集合を返す (変更があるまでブロック)"""
+        while stop_event is None or not stop_event.is_set():
+            for target in self._polled:
+                self._poll_target(target)
+            now = time.monotonic()
+            with self._lock:
+                ready = {key for key, t in self._pending.items() if now - t >= DEBOUNCE_SEC}
+                for key in ready:
+                    del self._pending[key]
+            if ready:
+                return ready
+            time.sleep(POLL_INTERVAL_SEC)
+        return set()
+
+    def close(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(timeout=5)
+            self._observer = None